@@ -0,0 +1,291 @@
+import gzip
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from selenium.common import InvalidArgumentException, WebDriverException
+
+from metrics import record_cache_lookup
+
+ARCHIVE_FILENAME = "pages.archive"
+INDEX_FILENAME = "index.jsonl"
+
+active_archive = None
+replaying = False
+
+
+class PageArchive:
+    """
+    Append-only archive of fetched pages. Each page is stored as its own gzip member holding a JSON header line (URL,
+    kind, status, headers, timestamp and run) followed by the body, and an index of JSON lines records the offset and
+    length of every member so a page can be read back without scanning the archive. Pages are looked up among the
+    versions recorded by a single run or before a cutoff time, if given, so an earlier run can be replayed.
+    """
+
+    def __init__(self, directory: str | Path, run: str | None = None, until: datetime | None = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.archive_path = self.directory / ARCHIVE_FILENAME
+        self.index_path = self.directory / INDEX_FILENAME
+        self.lock = threading.Lock()
+        self.run_id = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+        self.latest_entries = {}
+
+        for entry in self.iter_entries():
+            if (run is not None) and (entry.get("run") != run):
+                continue
+            if (until is not None) and (datetime.fromisoformat(entry["timestamp"]) > until):
+                continue
+
+            self.latest_entries[(entry["kind"], entry["url"])] = entry
+
+    def iter_entries(self) -> Iterator[dict]:
+        """
+        Reads the index of the archive in the order pages were fetched.
+
+        Returns:
+            Iterator of index entries.
+        """
+        if not self.index_path.exists():
+            return
+
+        with open(self.index_path, "r") as file:
+            for line in file:
+                yield json.loads(line)
+
+    def runs(self) -> dict[str, dict]:
+        """
+        Summarizes the runs recorded into the archive. Pages archived before runs were recorded belong to the run "".
+
+        Returns:
+            Dictionary mapping each run to the time of its first and last page and its number of pages, in the order
+            the runs were recorded.
+        """
+        runs = {}
+        for entry in self.iter_entries():
+            run = runs.setdefault(entry.get("run", ""), {"first": entry["timestamp"], "last": "", "pages": 0})
+            run["last"] = entry["timestamp"]
+            run["pages"] += 1
+
+        return runs
+
+    def record(self, kind: str, url: str, status: int | None, headers: dict, body: bytes) -> None:
+        """
+        Appends a page to the archive and its index.
+
+        Args:
+            kind: How the page was fetched, either "http" or "browser".
+            url: URL of the page.
+            status: The HTTP status code, if known.
+            headers: The response headers, if known.
+            body: The page body.
+
+        Returns:
+            None
+        """
+        timestamp = datetime.now().isoformat(timespec="seconds")
+        header = {"kind": kind, "url": url, "status": status, "headers": headers, "timestamp": timestamp,
+                  "run": self.run_id}
+        member = gzip.compress(json.dumps(header).encode("utf-8") + b"\n" + body)
+
+        with self.lock:
+            with open(self.archive_path, "ab") as file:
+                offset = file.tell()
+                file.write(member)
+
+            entry = {"kind": kind, "url": url, "status": status, "timestamp": timestamp, "run": self.run_id,
+                     "offset": offset, "length": len(member)}
+            with open(self.index_path, "a") as file:
+                file.write(json.dumps(entry) + "\n")
+
+            self.latest_entries[(kind, url)] = entry
+
+    def read(self, entry: dict) -> tuple[dict, bytes]:
+        """
+        Reads an archived page.
+
+        Args:
+            entry: The index entry of the page.
+
+        Returns:
+            The header and body of the page.
+        """
+        with open(self.archive_path, "rb") as file:
+            file.seek(entry["offset"])
+            member = gzip.decompress(file.read(entry["length"]))
+
+        header, _, body = member.partition(b"\n")
+        return json.loads(header), body
+
+    def lookup(self, kind: str, url: str) -> tuple[dict, bytes] | None:
+        """
+        Reads the most recently archived version of a page within the selected run or cutoff time, preferring pages
+        fetched the same way.
+
+        Args:
+            kind: How the page is fetched, either "http" or "browser".
+            url: URL of the page.
+
+        Returns:
+            The header and body of the page. None is returned if the page was never archived.
+        """
+        other_kind = "browser" if kind == "http" else "http"
+        entry = self.latest_entries.get((kind, url)) or self.latest_entries.get((other_kind, url))
+        return self.read(entry) if entry else None
+
+    def iter_pages(self, urls: set[str] | None = None) -> Iterator[tuple[dict, bytes]]:
+        """
+        Reads every archived page in the order it was fetched, for re-running parsers over the archive's history.
+
+        Args:
+            urls: Only read versions of these URLs, if given.
+
+        Returns:
+            Iterator of the header and body of each page.
+        """
+        for entry in self.iter_entries():
+            if (urls is None) or (entry["url"] in urls):
+                yield self.read(entry)
+
+
+class ArchiveSession(requests.Session):
+    """
+    HTTP session that records page fetches into the active archive, or serves them from it while replaying.
+    Streamed downloads, such as PDFs, always go to the network and are not archived.
+    """
+
+    def request(self, method, url, *args, **kwargs):
+        is_page = (method.upper() == "GET") and (not kwargs.get("stream"))
+
+        if (active_archive is not None) and replaying and is_page:
+            return replay_response(url)
+
+        response = super().request(method, url, *args, **kwargs)
+
+        if (active_archive is not None) and (not replaying) and is_page:
+            active_archive.record("http", url, response.status_code, dict(response.headers), response.content)
+
+        return response
+
+
+class RecordingDriver:
+    """
+    Wraps a web driver so that every page source read by a parser is recorded into the active archive.
+    """
+
+    def __init__(self, driver):
+        self._driver = driver
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+    @property
+    def page_source(self) -> str:
+        page_source = self._driver.page_source
+
+        url = self._driver.current_url
+        if (active_archive is not None) and url.startswith("http"):
+            active_archive.record("browser", url, None, {}, page_source.encode("utf-8"))
+
+        return page_source
+
+
+class ReplayDriver:
+    """
+    Stands in for a web driver while replaying, serving page sources from the active archive without a browser.
+    Printing is not available, since the archive holds page sources rather than rendered pages.
+    """
+
+    def __init__(self):
+        self.current_url = ""
+
+    def get(self, url: str) -> None:
+        self.current_url = url
+
+    @property
+    def page_source(self) -> str:
+        archived_page = active_archive.lookup("browser", self.current_url)
+        record_cache_lookup("archive", archived_page is not None)
+        if archived_page is None:
+            raise WebDriverException(f"\"{self.current_url}\" is not in the archive")
+
+        return archived_page[1].decode("utf-8")
+
+    def execute_script(self, script: str, *args) -> None:
+        return None
+
+    def execute_cdp_cmd(self, cmd: str, cmd_args: dict) -> dict:
+        raise InvalidArgumentException("Printing is not available while replaying")
+
+    def print_page(self, print_options) -> str:
+        raise InvalidArgumentException("Printing is not available while replaying")
+
+    def quit(self) -> None:
+        pass
+
+
+def start_recording(directory: str | Path) -> None:
+    """
+    Records every page fetched from now on into the archive in the given directory.
+
+    Args:
+        directory: The archive directory.
+
+    Returns:
+        None
+    """
+    global active_archive, replaying
+    active_archive = PageArchive(directory)
+    replaying = False
+
+
+def start_replay(directory: str | Path, run: str | None = None, until: datetime | None = None) -> None:
+    """
+    Serves every page fetched from now on from the archive in the given directory instead of the network.
+
+    Args:
+        directory: The archive directory.
+        run: Only serve pages recorded by this run, if given.
+        until: Only serve pages recorded at or before this time, if given.
+
+    Returns:
+        None
+    """
+    global active_archive, replaying
+    active_archive = PageArchive(directory, run, until)
+    replaying = True
+
+
+def replay_response(url: str) -> requests.Response:
+    """
+    Builds an HTTP response from the most recently archived version of a page within the selected run or cutoff
+    time. Pages that were never archived are answered with a 504 status, like a cache-only request.
+
+    Args:
+        url: URL of the page.
+
+    Returns:
+        The HTTP response.
+    """
+    response = requests.Response()
+    response.url = url
+
+    archived_page = active_archive.lookup("http", url)
+    record_cache_lookup("archive", archived_page is not None)
+    if archived_page is None:
+        response.status_code = 504
+        response._content = b""
+        return response
+
+    header, body = archived_page
+    response.status_code = header["status"] or 200
+    response.headers = CaseInsensitiveDict(header["headers"])
+    response.encoding = get_encoding_from_headers(response.headers) or "utf-8"
+    response._content = body
+    return response
@@ -1,14 +1,53 @@
 import datetime as dt
+import json
 import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from io import StringIO
 
 import pandas as pd
+import requests
 from bs4 import BeautifulSoup, Tag
 from pandas import DataFrame
 from selenium.common import TimeoutException, WebDriverException
 
+from metrics import measure, PARSE_SECONDS
 from utils import initialize_web_driver, sanitize_html, download_pdf_to_cwd, print_failure_message, BOLD, GREEN, NORMAL, \
-    RED
+    RED, REMOVE_OVERLAYS_SCRIPT, create_http_session, write_chunks_to_cwd, print_success_message, HTTP_TIMEOUT, \
+    MAX_WORKERS, LazyWebDriver
+
+ARTICLE_FORMATS = ["pdf", "markdown", "json"]
+
+ARTICLE_EXTENSIONS = {
+    "markdown": "md",
+    "json": "json",
+}
+
+ARTICLE_BODY_SELECTORS = [
+    "div.c-story-blocks",
+    "div.story-page__content",
+    "div.vue-story-content",
+    "div.article-content",
+    "article",
+    "main",
+]
+
+ARTICLE_CLUTTER_SELECTORS = ", ".join([
+    "script",
+    "style",
+    "noscript",
+    "iframe",
+    "aside",
+    "figure",
+    "nav",
+    "form",
+    "blockquote.twitter-tweet",
+    "blockquote.instagram-media",
+    "div.s-ad",
+    "div.story-page__share",
+    "div.c-story-related",
+])
+
+ARTICLE_TEXT_TAGS = ["h2", "h3", "h4", "p", "li"]
 
 
 def fetch_articles(team_data: dict, date_range: list[dt.date]) -> DataFrame | None:
@@ -56,12 +95,13 @@ def fetch_articles(team_data: dict, date_range: list[dt.date]) -> DataFrame | No
     return None
 
 
-def download_articles(articles: DataFrame) -> None:
+def download_articles(articles: DataFrame, metadata: dict | None = None) -> None:
     """
     Downloads selected articles into respective PDF files.
 
     Args:
         articles: DataFrame of articles to download containing the date posted, headline, and URL.
+        metadata: Dictionary describing the files (team, category, season, source_url), passed to output hooks.
 
     Returns:
         None
@@ -71,34 +111,229 @@ def download_articles(articles: DataFrame) -> None:
 
     driver = initialize_web_driver()
 
-    script = """
-        let removed = document.getElementById('divSatisfiChat'); 
-        if (removed) removed.parentNode.removeChild(removed);
-
-        removed = document.getElementById('transcend-consent-manager'); 
-        if (removed) removed.parentNode.removeChild(removed);
-
-        removed = document.getElementById('termly-code-snippet-support'); 
-        if (removed) removed.parentNode.removeChild(removed);
-    """
-
     for _, row in articles.iterrows():
-        headline = row["Headline"].replace("/", "_")
-        filename = f"{headline}.pdf"
+        filename = get_article_filename(row, "pdf")
 
         try:
             driver.get(row["URL"])
             time.sleep(1)
 
-            driver.execute_script(script)
+            driver.execute_script(REMOVE_OVERLAYS_SCRIPT)
 
-            download_pdf_to_cwd(driver, filename)
+            download_pdf_to_cwd(driver, filename, {
+                "category": "Articles",
+                "season": str(row["Date"].year),
+                "source_url": row["URL"],
+                **(metadata or {})
+            })
         except TimeoutException as e:
             print_failure_message(filename, e.msg)
 
     driver.quit()
 
 
+def extract_articles(articles: DataFrame, article_format: str, metadata: dict | None = None) -> None:
+    """
+    Extracts the text of selected articles into compact Markdown or JSON files. Articles are fetched concurrently
+    over a pooled HTTP session, and their bodies are parsed in a process pool as they arrive. Articles whose story
+    body is not in the HTTP response, such as pages rendered with JavaScript, are loaded with the browser instead.
+
+    Args:
+        articles: DataFrame of articles to download containing the date posted, headline, and URL.
+        article_format: Either "markdown" or "json".
+        metadata: Dictionary describing the files (team, category, season, source_url), passed to output hooks.
+
+    Returns:
+        None
+    """
+    if len(articles) == 0:
+        return
+
+    rows = [row for _, row in articles.iterrows()]
+
+    with create_http_session() as session, ThreadPoolExecutor(max_workers=MAX_WORKERS) as fetch_executor, \
+            ProcessPoolExecutor(max_workers=MAX_WORKERS) as parse_executor:
+        fetches = {fetch_executor.submit(fetch_article_source, session, row["URL"]): row for row in rows}
+
+        parses = {}
+        for future in as_completed(fetches):
+            row = fetches[future]
+            try:
+                parses[parse_executor.submit(parse_article_body, future.result())] = row
+            except requests.RequestException as e:
+                print_failure_message(get_article_filename(row, article_format), str(e))
+
+        unparsed_rows = []
+        for future in as_completed(parses):
+            row = parses[future]
+            blocks = future.result()
+            if blocks:
+                write_article(row, blocks, article_format, metadata)
+            else:
+                unparsed_rows.append(row)
+
+    if unparsed_rows:
+        extract_articles_with_browser(unparsed_rows, article_format, metadata)
+
+
+def extract_articles_with_browser(rows: list[pd.Series], article_format: str, metadata: dict | None = None) -> None:
+    """
+    Extracts the text of articles whose story body could not be found over plain HTTP by loading them with the
+    browser. Articles whose story body still cannot be found are reported as failures.
+
+    Args:
+        rows: List of the articles' rows, containing the date posted, headline, and URL.
+        article_format: Either "markdown" or "json".
+        metadata: Dictionary describing the files (team, category, season, source_url), passed to output hooks.
+
+    Returns:
+        None
+    """
+    lazy_driver = LazyWebDriver()
+
+    try:
+        for index, row in enumerate(rows):
+            filename = get_article_filename(row, article_format)
+
+            try:
+                driver = lazy_driver.get()
+                driver.get(row["URL"])
+                time.sleep(1)
+
+                blocks = parse_article_body(driver.page_source)
+            except RuntimeError as e:
+                for remaining_row in rows[index:]:
+                    print_failure_message(get_article_filename(remaining_row, article_format), str(e))
+                return
+            except TimeoutException as e:
+                print_failure_message(filename, e.msg)
+                continue
+            except WebDriverException as e:
+                print_failure_message(filename, e.msg)
+                continue
+
+            if blocks:
+                write_article(row, blocks, article_format, metadata)
+            else:
+                print_failure_message(filename, "Could not find the story body")
+    finally:
+        lazy_driver.quit()
+
+
+def fetch_article_source(session: requests.Session, url: str) -> str:
+    """
+    Fetches the HTML source of an article.
+
+    Args:
+        session: The HTTP session to send the request with.
+        url: URL of the article.
+
+    Returns:
+        The page source.
+    """
+    response = session.get(url, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    return response.text
+
+
+def parse_article_body(page_source: str) -> list[str]:
+    """
+    Isolates the story body of an article page and converts it into Markdown blocks. The body is found with the first
+    matching selector of ARTICLE_BODY_SELECTORS, and embedded tweets, advertisements and other clutter are removed.
+    Pages without a story body are never parsed whole, since their text would be navigation rather than the story.
+    Runs in a worker process.
+
+    Args:
+        page_source: The HTML source of the article page.
+
+    Returns:
+        List of Markdown blocks, one per heading, paragraph or list item. An empty list is returned if the page has no
+        story body.
+    """
+    doc = BeautifulSoup(page_source, "lxml")
+
+    body = next((tag for tag in (doc.select_one(selector) for selector in ARTICLE_BODY_SELECTORS) if tag), None)
+    if body is None:
+        return []
+
+    body = BeautifulSoup(sanitize_html(body), "lxml")
+
+    for tag in body.select(ARTICLE_CLUTTER_SELECTORS):
+        tag.decompose()
+
+    blocks = []
+    for tag in body.find_all(ARTICLE_TEXT_TAGS):
+        if (tag.name == "p") and (tag.find_parent("li") is not None):
+            continue
+
+        text = " ".join(tag.get_text(" ", strip=True).split())
+        if not text:
+            continue
+
+        if tag.name == "li":
+            blocks.append(f"- {text}")
+        elif tag.name != "p":
+            blocks.append(f"{'#' * int(tag.name[1])} {text}")
+        else:
+            blocks.append(text)
+
+    return blocks
+
+
+def write_article(row: pd.Series, blocks: list[str], article_format: str, metadata: dict | None = None) -> None:
+    """
+    Writes the date, headline and body of an extracted article to a file in the current working directory.
+
+    Args:
+        row: The article's row, containing the date posted, headline, and URL.
+        blocks: List of Markdown blocks of the article's body.
+        article_format: Either "markdown" or "json".
+        metadata: Dictionary describing the file (team, category, season, source_url), passed to output hooks.
+
+    Returns:
+        None
+    """
+    filename = get_article_filename(row, article_format)
+    date = pd.Timestamp(row["Date"]).date().isoformat()
+
+    if article_format == "json":
+        content = json.dumps({
+            "date": date,
+            "headline": row["Headline"],
+            "url": row["URL"],
+            "body": "\n\n".join(blocks)
+        }, indent=2, ensure_ascii=False)
+    else:
+        content = "\n\n".join([f"# {row['Headline']}", f"{date} | <{row['URL']}>", *blocks])
+
+    try:
+        write_chunks_to_cwd([(content + "\n").encode("utf-8")], filename, {
+            "category": "Articles",
+            "season": str(row["Date"].year),
+            "source_url": row["URL"],
+            **(metadata or {})
+        })
+        print_success_message(filename)
+    except OSError as e:
+        print_failure_message(filename, str(e))
+
+
+def get_article_filename(row: pd.Series, article_format: str) -> str:
+    """
+    Builds the filename of an article from its headline.
+
+    Args:
+        row: The article's row, containing the date posted, headline, and URL.
+        article_format: One of ARTICLE_FORMATS.
+
+    Returns:
+        The filename.
+    """
+    headline = row["Headline"].replace("/", "_")
+    return f"{headline}.{ARTICLE_EXTENSIONS.get(article_format, 'pdf')}"
+
+
+@measure(PARSE_SECONDS, parser="articles")
 def scan_table_for_articles(team_data: dict, table: Tag, date_range: list[dt.date]) -> DataFrame:
     """
     Scans through an HTML table and returns a DataFrame containing the date posted, headline, and URL.
@@ -132,6 +367,7 @@ def scan_table_for_articles(team_data: dict, table: Tag, date_range: list[dt.dat
     return dataframe[(dataframe["Date"].dt.date >= start_date) & (dataframe["Date"].dt.date <= end_date)]
 
 
+@measure(PARSE_SECONDS, parser="articles")
 def scan_ul_for_articles(team_data: dict, ul: Tag, date_range: list[dt.date]) -> DataFrame:
     """
     Scans through an HTML list and returns a DataFrame containing the date posted, headline, and URL.
@@ -0,0 +1,144 @@
+import argparse
+import base64
+import os
+import tempfile
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from utils import iter_print_page_chunks, write_chunks_to_cwd, response_pdf_to_cwd, PDF_CHUNK_SIZE
+
+MEGABYTE = 1024 * 1024
+
+
+class FakePrintingDriver:
+    """
+    Stands in for a Chrome driver whose current page prints to a PDF of a given size. The stream is generated chunk
+    by chunk, so the fake itself never holds the whole document.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.remaining = 0
+
+    def print_page(self, print_options) -> str:
+        return base64.b64encode(b"\0" * self.size).decode("ascii")
+
+    def execute_cdp_cmd(self, cmd: str, cmd_args: dict) -> dict:
+        if cmd == "Page.printToPDF":
+            self.remaining = self.size
+            return {"stream": "fake-stream"}
+
+        if cmd == "IO.read":
+            chunk_size = min(cmd_args["size"], self.remaining)
+            self.remaining -= chunk_size
+            data = base64.b64encode(b"\0" * chunk_size).decode("ascii")
+            return {"base64Encoded": True, "data": data, "eof": self.remaining == 0}
+
+        return {}
+
+
+def start_pdf_server(size: int) -> ThreadingHTTPServer:
+    """
+    Starts a local HTTP server that answers every GET request with a PDF body of the given size.
+
+    Args:
+        size: The size of the response body in bytes.
+
+    Returns:
+        The running server.
+    """
+
+    class PdfHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+
+            remaining = size
+            while remaining > 0:
+                chunk_size = min(PDF_CHUNK_SIZE, remaining)
+                self.wfile.write(b"\0" * chunk_size)
+                remaining -= chunk_size
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PdfHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def buffered_print_to_cwd(driver: FakePrintingDriver, filename: str) -> None:
+    """
+    Prints a page the way download_pdf_to_cwd used to, holding the base64 string and the decoded bytes in memory.
+    """
+    pdf_bytes = base64.b64decode(driver.print_page(None))
+    with open(os.getcwd() + "/" + filename, "wb") as file:
+        file.write(pdf_bytes)
+
+
+def buffered_response_to_cwd(pdf_url: str, filename: str) -> None:
+    """
+    Downloads a PDF the way response_pdf_to_cwd used to, holding the whole response body in memory.
+    """
+    response = requests.get(pdf_url)
+    with open(os.getcwd() + "/" + filename, "wb") as file:
+        file.write(response.content)
+
+
+def measure_peak(function, *args) -> int:
+    """
+    Measures the peak memory allocated by Python while running a function.
+
+    Args:
+        function: The function to run.
+        *args: The arguments to pass to the function.
+
+    Returns:
+        The peak number of bytes allocated.
+    """
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare peak memory of buffered and streamed PDF output")
+    parser.add_argument("-s", "--sizes",
+                        nargs="+",
+                        type=int,
+                        default=[8, 32, 128],
+                        help="Accepts PDF sizes in megabytes (e.g., -s 8 32 128)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        os.chdir(output_dir)
+
+        print(f"{'Size':>8} | {'Path':<6} | {'Buffered peak':>14} | {'Streamed peak':>14}")
+        for size_mb in args.sizes:
+            size = size_mb * MEGABYTE
+
+            driver = FakePrintingDriver(size)
+            buffered_peak = measure_peak(buffered_print_to_cwd, driver, "buffered.pdf")
+            streamed_peak = measure_peak(lambda: write_chunks_to_cwd(iter_print_page_chunks(driver), "streamed.pdf"))
+            print(f"{size_mb:>6}MB | {'print':<6} | {buffered_peak / MEGABYTE:>12.1f}MB | "
+                  f"{streamed_peak / MEGABYTE:>12.1f}MB")
+
+            server = start_pdf_server(size)
+            pdf_url = f"http://127.0.0.1:{server.server_address[1]}/document.pdf"
+            buffered_peak = measure_peak(buffered_response_to_cwd, pdf_url, "buffered.pdf")
+            streamed_peak = measure_peak(response_pdf_to_cwd, pdf_url, "streamed.pdf")
+            server.shutdown()
+            print(f"{size_mb:>6}MB | {'http':<6} | {buffered_peak / MEGABYTE:>12.1f}MB | "
+                  f"{streamed_peak / MEGABYTE:>12.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
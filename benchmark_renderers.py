@@ -0,0 +1,87 @@
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+from selenium.common import WebDriverException
+
+from renderers import ChromeRenderer, WkhtmltopdfRenderer
+from schedule import build_html_document
+
+
+def build_sample_schedule(rows: int) -> str:
+    """
+    Builds a schedule document like the one download_schedule generates, filled with sample matches.
+
+    Args:
+        rows: The number of matches in the schedule.
+
+    Returns:
+        The HTML document.
+    """
+    dataframe = pd.DataFrame({
+        "Date": [f"Sep {day % 30 + 1} (Sat)" for day in range(rows)],
+        "Opponent": [f"Opponent {row}" for row in range(rows)],
+        "Location": ["Evanston, Ill." if row % 2 else "Away" for row in range(rows)],
+        "Result": [f"W, {row % 4}-{row % 3}" for row in range(rows)],
+    })
+    return build_html_document("Sample Schedule", [dataframe.to_html(index=False)])
+
+
+def time_renderer(renderer_class, html: str, documents: int) -> float | None:
+    """
+    Measures how long a backend takes to render a number of documents, including its startup and shutdown.
+
+    Args:
+        renderer_class: The renderer class of the backend.
+        html: The HTML document to render.
+        documents: The number of documents to render.
+
+    Returns:
+        The elapsed time in seconds. None is returned if the backend is not available.
+    """
+    start = time.perf_counter()
+    try:
+        renderer = renderer_class()
+        try:
+            for document in range(documents):
+                renderer.render_html(html, f"{renderer_class.name} {document}.pdf")
+        finally:
+            renderer.close()
+    except (RuntimeError, OSError, WebDriverException) as e:
+        print(f"{renderer_class.name}: unavailable ({e})")
+        return None
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the time taken by each PDF rendering backend")
+    parser.add_argument("-d", "--documents",
+                        type=int,
+                        default=16,
+                        help="Accepts the number of documents to render (e.g., -d 16)")
+    parser.add_argument("-r", "--rows",
+                        type=int,
+                        default=40,
+                        help="Accepts the number of matches per document (e.g., -r 40)")
+    args = parser.parse_args()
+
+    html = build_sample_schedule(args.rows)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        os.chdir(output_dir)
+
+        results = {}
+        for renderer_class in [ChromeRenderer, WkhtmltopdfRenderer]:
+            results[renderer_class.name] = time_renderer(renderer_class, html, args.documents)
+
+    print(f"{'Backend':<12} | {'Total':>8} | {'Per document':>12}")
+    for name, elapsed in results.items():
+        if elapsed is not None:
+            print(f"{name:<12} | {elapsed:>7.2f}s | {elapsed / args.documents:>11.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,21 @@
+import os
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
+import requests
 from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.common import TimeoutException, ElementNotVisibleException, WebDriverException
 
-from utils import initialize_web_driver, response_pdf_to_cwd, print_failure_message
+from metrics import measure, record_cache_lookup, PARSE_SECONDS
+from utils import response_pdf_to_cwd, print_failure_message, create_http_session, stream_response_to_path, \
+    link_file_to_cwd, http_get, LazyWebDriver, PooledWebDriver, MAX_WORKERS, HTTP_TIMEOUT
+
+sidearm_calendar_cache: dict[tuple[str, int], list[tuple[str, str, str, str]]] = {}
+sidearm_calendar_lock = threading.Lock()
 
 
 def download_box_scores(team_data: dict, count: int) -> None:
@@ -17,12 +28,14 @@ def download_box_scores(team_data: dict, count: int) -> None:
     Returns:
         None
     """
-    driver = initialize_web_driver()
+    lazy_driver = LazyWebDriver()
+    metadata = {"team": team_data["name"], "category": "Box Scores", "season": str(datetime.now().year)}
 
     try:
         if team_data["conference_schedule_provider"] == "Boost":
             schedule_url = f"{team_data['conference_base_url']}/msoc/schedule/?teamFilter={team_data['abbreviation']}"
 
+            driver = lazy_driver.get()
             driver.get(schedule_url)
             time.sleep(1)
             doc = BeautifulSoup(driver.page_source, "lxml")
@@ -32,27 +45,104 @@ def download_box_scores(team_data: dict, count: int) -> None:
             for box_score_pdf_url in box_score_pdf_urls:
                 filename = box_score_pdf_url.split("/")[-1]
 
-                response_pdf_to_cwd(box_score_pdf_url, filename)
+                response_pdf_to_cwd(box_score_pdf_url, filename, metadata)
         elif team_data["conference_schedule_provider"] == "Sidearm":
-            schedule_url = f"{team_data['conference_base_url']}/calendar.aspx?path=msoc"
+            box_score_pdf_urls = get_sidearm_match_data(lazy_driver, team_data, count)
 
-            driver.get(schedule_url)
-            time.sleep(1)
-            doc = BeautifulSoup(driver.page_source, "lxml")
+            for home_team, away_team, date, box_score_pdf_url in box_score_pdf_urls:
+                filename = f"{home_team} vs {away_team} {date}.pdf"
 
-            box_score_pdf_urls = get_sidearm_match_data(driver, team_data, doc, count)
+                response_pdf_to_cwd(box_score_pdf_url, filename, metadata)
+    except TimeoutException as e:
+        print_failure_message("Box Scores", e.msg)
+    except WebDriverException as e:
+        print_failure_message("Box Scores", e.msg)
 
-            for home_team, away_team, date, box_score_pdf_url in box_score_pdf_urls:
+    finally:
+        lazy_driver.quit()
+
+
+def download_box_scores_by_url(team_data: dict, box_score_urls: list[str]) -> None:
+    """
+    Downloads specific box scores of a team, identified by the URLs found on its conference schedule. For Sidearm
+    conferences, the calendar must already be cached, as it is when the schedule has just been checked.
+
+    Args:
+        team_data: Dictionary containing team data.
+        box_score_urls: List of box score URLs, PDF URLs for Boost and box score page URLs for Sidearm.
+
+    Returns:
+        None
+    """
+    lazy_driver = LazyWebDriver()
+    metadata = {"team": team_data["name"], "category": "Box Scores", "season": str(datetime.now().year)}
+
+    try:
+        if team_data["conference_schedule_provider"] == "Boost":
+            for box_score_pdf_url in box_score_urls:
+                filename = box_score_pdf_url.split("/")[-1]
+
+                response_pdf_to_cwd(box_score_pdf_url, filename, metadata)
+        elif team_data["conference_schedule_provider"] == "Sidearm":
+            calendar_matches = get_sidearm_calendar_matches(lazy_driver, team_data["conference_base_url"])
+            matches = [match for match in calendar_matches if match[3] in box_score_urls]
+
+            for home_team, away_team, date, box_score_pdf_url in resolve_sidearm_pdf_urls(lazy_driver, matches,
+                                                                                          team_data, len(matches)):
                 filename = f"{home_team} vs {away_team} {date}.pdf"
 
-                response_pdf_to_cwd(box_score_pdf_url, filename)
+                response_pdf_to_cwd(box_score_pdf_url, filename, metadata)
     except TimeoutException as e:
         print_failure_message("Box Scores", e.msg)
     except WebDriverException as e:
         print_failure_message("Box Scores", e.msg)
 
     finally:
-        driver.quit()
+        lazy_driver.quit()
+
+
+def get_latest_box_score_url(session: requests.Session, lazy_driver: LazyWebDriver | PooledWebDriver,
+                             team_data: dict) -> str | None:
+    """
+    Get the URL of a team's most recent box score, which changes whenever a new result has been posted. Safe to call
+    from several threads.
+
+    Args:
+        session: The HTTP session to send requests with.
+        lazy_driver: The web driver, only launched if the schedule cannot be fetched over plain HTTP.
+        team_data: Dictionary containing team data.
+
+    Returns:
+        The URL of the most recent box score. None is returned if no box score was found.
+    """
+    if team_data["conference_schedule_provider"] == "Boost":
+        schedule_url = f"{team_data['conference_base_url']}/msoc/schedule/?teamFilter={team_data['abbreviation']}"
+
+        doc = None
+        try:
+            response = session.get(schedule_url, timeout=HTTP_TIMEOUT)
+            if response.ok:
+                doc = BeautifulSoup(response.text, "lxml")
+        except requests.RequestException:
+            pass
+
+        if (doc is None) or (doc.find("table") is None):
+            driver = lazy_driver.get()
+            driver.get(schedule_url)
+            time.sleep(1)
+            doc = BeautifulSoup(driver.page_source, "lxml")
+
+        if doc.find("table") is None:
+            return None
+
+        box_score_pdf_urls = get_boost_box_score_pdf_urls(doc, team_data["name"], team_data["abbreviation"], 1)
+        return box_score_pdf_urls[-1] if box_score_pdf_urls else None
+    elif team_data["conference_schedule_provider"] == "Sidearm":
+        calendar_matches = get_sidearm_calendar_matches(lazy_driver, team_data["conference_base_url"])
+        matches = [match for match in calendar_matches if team_data["name"] in (match[0], match[1])]
+        return matches[-1][3] if matches else None
+
+    return None
 
 
 def get_boost_box_score_pdf_urls(doc: BeautifulSoup, team_name: str, team_abbreviation: str, count: int) -> list[str]:
@@ -69,40 +159,289 @@ def get_boost_box_score_pdf_urls(doc: BeautifulSoup, team_name: str, team_abbrev
         List of box score PDF URLs.
     """
     box_score_pdf_urls = []
+    for first_team, second_team, box_score_pdf_url in get_boost_conference_matches(doc):
+        if (team_name != first_team) and (team_name != second_team) and (
+                team_abbreviation != first_team) and (team_abbreviation != second_team):
+            continue
+
+        box_score_pdf_urls.append(box_score_pdf_url)
+
+    count = min(len(box_score_pdf_urls), count)
+    return box_score_pdf_urls[-count:]
+
+
+def get_boost_conference_matches(doc: BeautifulSoup) -> list[tuple[str, str, str]]:
+    """
+    Get every match with a box score from a schedule page provided by Boost, regardless of the teams playing.
+
+    Args:
+        doc: The BeautifulSoup object containing the parsed HTML.
+
+    Returns:
+        List of match data represented as a tuple of the form (first_team, second_team, box_score_pdf_url).
+    """
+    matches = []
     schedule_table = doc.find("table")
     for table_row in schedule_table.find("tbody").find_all("tr"):
         table_cells = table_row.find_all("td")
 
-        if (team_name != table_cells[2].text) and (team_name != table_cells[4].text) and (
-                team_abbreviation != table_cells[2].text) and (team_abbreviation != table_cells[4].text):
-            continue
-
         anchor = table_row.find("a", string="Box Score")
         if anchor:
-            box_score_pdf_urls.append(anchor["href"])
+            matches.append((table_cells[2].text, table_cells[4].text, anchor["href"]))
 
-    count = min(len(box_score_pdf_urls), count)
-    return box_score_pdf_urls[-count:]
+    return matches
+
+
+def download_conference_box_scores(teams_data: list[dict], count: int) -> None:
+    """
+    Downloads the box scores of several teams into one folder per team. Each conference schedule is fetched once, and
+    a match between two of the teams is only downloaded once and linked into both teams' folders.
+
+    Args:
+        teams_data: List of dictionaries containing team data.
+        count: The number of box scores to print per team.
+
+    Returns:
+        None
+    """
+    conferences = {}
+    for team_data in teams_data:
+        conference_key = (team_data["conference_schedule_provider"], team_data["conference_base_url"])
+        conferences.setdefault(conference_key, []).append(team_data)
+
+    lazy_driver = LazyWebDriver()
+    try:
+        for (provider, conference_base_url), conference_teams in conferences.items():
+            try:
+                if provider == "Boost":
+                    match_index = index_boost_conference_matches(lazy_driver, conference_base_url, conference_teams,
+                                                                 count)
+                elif provider == "Sidearm":
+                    match_index = index_sidearm_conference_matches(lazy_driver, conference_base_url,
+                                                                   conference_teams, count)
+                else:
+                    continue
+
+                download_indexed_box_scores(match_index)
+            except TimeoutException as e:
+                print_failure_message(f"{conference_base_url} Box Scores", e.msg)
+            except WebDriverException as e:
+                print_failure_message(f"{conference_base_url} Box Scores", e.msg)
+    finally:
+        lazy_driver.quit()
+
+
+def index_boost_conference_matches(lazy_driver: LazyWebDriver, conference_base_url: str, teams_data: list[dict],
+                                   count: int) -> dict[str, tuple[str, list[str]]]:
+    """
+    Index the most recent box scores of several teams from a single fetch of a Boost conference schedule.
+
+    Args:
+        lazy_driver: The web driver, only launched if the schedule cannot be fetched over plain HTTP.
+        conference_base_url: The base URL of the conference website.
+        teams_data: List of dictionaries containing team data.
+        count: The number of box scores to print per team.
+
+    Returns:
+        Dictionary mapping each box score PDF URL to its filename and the names of the participating teams.
+    """
+    schedule_url = f"{conference_base_url}/msoc/schedule/"
+
+    doc = None
+    try:
+        response = http_get(schedule_url)
+        if response.ok:
+            doc = BeautifulSoup(response.text, "lxml")
+    except requests.RequestException:
+        pass
+
+    if (doc is None) or (doc.find("table") is None):
+        driver = lazy_driver.get()
+        driver.get(schedule_url)
+        time.sleep(1)
+        doc = BeautifulSoup(driver.page_source, "lxml")
+
+    match_index = {}
+    for team_data in teams_data:
+        for box_score_pdf_url in get_boost_box_score_pdf_urls(doc, team_data["name"], team_data["abbreviation"],
+                                                              count):
+            filename = box_score_pdf_url.split("/")[-1]
+            match_index.setdefault(box_score_pdf_url, (filename, []))[1].append(team_data["name"])
+
+    return match_index
+
+
+def index_sidearm_conference_matches(lazy_driver: LazyWebDriver, conference_base_url: str, teams_data: list[dict],
+                                     count: int) -> dict[str, tuple[str, list[str]]]:
+    """
+    Index the most recent box scores of several teams from a single fetch of a Sidearm conference calendar. The PDF
+    URL of a match is only resolved once, even if both of its teams were requested.
+
+    Args:
+        lazy_driver: The web driver, only launched if a page cannot be resolved over plain HTTP.
+        conference_base_url: The base URL of the conference website.
+        teams_data: List of dictionaries containing team data.
+        count: The number of box scores to print per team.
 
+    Returns:
+        Dictionary mapping each box score PDF URL to its filename and the names of the participating teams.
+    """
+    calendar_matches = get_sidearm_calendar_matches(lazy_driver, conference_base_url)
+
+    participants_by_match = {}
+    for team_data in teams_data:
+        matches = [match for match in calendar_matches if team_data["name"] in (match[0], match[1])]
+        for match in matches[-count:]:
+            participants_by_match.setdefault(match[:3], []).append(team_data["name"])
+
+    unique_matches = [match for match in calendar_matches if match[:3] in participants_by_match]
+    match_data = resolve_sidearm_pdf_urls(lazy_driver, unique_matches, teams_data[0], len(unique_matches))
+
+    match_index = {}
+    for home_team, away_team, date, box_score_pdf_url in match_data:
+        participants = participants_by_match[(home_team, away_team, date)]
+        match_index[box_score_pdf_url] = (f"{home_team} vs {away_team} {date}.pdf", participants)
+
+    return match_index
 
-def get_sidearm_match_data(driver: webdriver.Chrome, team_data: dict, doc: BeautifulSoup, count: int) -> list[
+
+def download_indexed_box_scores(match_index: dict[str, tuple[str, list[str]]]) -> None:
+    """
+    Downloads each indexed box score once, then links it into the folder of every participating team.
+
+    Args:
+        match_index: Dictionary mapping each box score PDF URL to its filename and the names of the participating
+            teams.
+
+    Returns:
+        None
+    """
+    season = str(datetime.now().year)
+
+    with create_http_session() as session, tempfile.TemporaryDirectory(dir=os.getcwd(), prefix=".box-scores-") as \
+            download_dir:
+        def download_box_score(box_score_pdf_url: str) -> None:
+            filename, participants = match_index[box_score_pdf_url]
+            download_path = os.path.join(download_dir, filename)
+
+            try:
+                response = session.get(box_score_pdf_url, stream=True, timeout=HTTP_TIMEOUT)
+                if response.status_code == 404:
+                    response.close()
+                    print_failure_message(filename, "Found a PDF URL, but it doesn't link to an existing file")
+                    return
+
+                stream_response_to_path(response, download_path)
+            except requests.RequestException as e:
+                print_failure_message(filename, str(e))
+                return
+
+            for team_name in participants:
+                link_file_to_cwd(download_path, f"{team_name}/{filename}", {
+                    "team": team_name,
+                    "category": "Box Scores",
+                    "season": season,
+                    "source_url": box_score_pdf_url
+                })
+
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            list(executor.map(download_box_score, match_index.keys()))
+
+
+def get_sidearm_match_data(lazy_driver: LazyWebDriver, team_data: dict, count: int) -> list[
     tuple[str, str, str, str]]:
     """
     Get the URLs of the box scores from the conference websites provided by Sidearm.
 
     Args:
-        driver: The WebDriver.
+        lazy_driver: The web driver, only launched if a page cannot be resolved over plain HTTP.
         team_data: Dictionary containing team data.
-        doc: The BeautifulSoup object containing the parsed HTML.
         count: The number of box scores to print.
 
     Returns:
         List of match data represented as a tuple of the form (home_team, away_team, date, box_score_pdf_url).
     """
-    match_tables = doc.find_all("table")
-    matches = extract_matches(team_data, match_tables)
+    calendar_matches = get_sidearm_calendar_matches(lazy_driver, team_data["conference_base_url"])
+    matches = [match for match in calendar_matches if team_data["name"] in (match[0], match[1])]
+
+    return resolve_sidearm_pdf_urls(lazy_driver, matches, team_data, count)
+
+
+def get_sidearm_calendar_matches(lazy_driver: LazyWebDriver | PooledWebDriver, conference_base_url: str,
+                                 season: int | None = None) -> list[tuple[str, str, str, str]]:
+    """
+    Get every match with a box score on a Sidearm conference calendar. The parsed calendar is cached per season, so
+    the calendar page is only fetched once no matter how many teams of the conference are requested, even from
+    several threads.
+
+    Args:
+        lazy_driver: The web driver, only launched if the calendar cannot be fetched over plain HTTP.
+        conference_base_url: The base URL of the conference website.
+        season: The season of the calendar, defaults to the current year.
+
+    Returns:
+        List of match data represented as a tuple of the form (home_team, away_team, date, box_score_url).
+    """
+    season = season or datetime.now().year
+    cache_key = (conference_base_url, season)
+    with sidearm_calendar_lock:
+        record_cache_lookup("sidearm_calendar", cache_key in sidearm_calendar_cache)
+        if cache_key in sidearm_calendar_cache:
+            return sidearm_calendar_cache[cache_key]
+
+        return fetch_sidearm_calendar(lazy_driver, conference_base_url, season)
+
+
+def fetch_sidearm_calendar(lazy_driver: LazyWebDriver | PooledWebDriver, conference_base_url: str,
+                           season: int) -> list[tuple[str, str, str, str]]:
+    """
+    Fetches a Sidearm conference calendar, over plain HTTP if possible and with the browser otherwise, and caches it.
 
-    return fetch_pdf_urls_for_matches(driver, matches, team_data, count)
+    Args:
+        lazy_driver: The web driver, only launched if the calendar cannot be fetched over plain HTTP.
+        conference_base_url: The base URL of the conference website.
+        season: The season of the calendar.
+
+    Returns:
+        List of match data represented as a tuple of the form (home_team, away_team, date, box_score_url).
+    """
+    schedule_url = f"{conference_base_url}/calendar.aspx?path=msoc"
+
+    match_tables = []
+    try:
+        response = http_get(schedule_url)
+        if response.ok:
+            match_tables = BeautifulSoup(response.text, "lxml").find_all("table")
+    except requests.RequestException:
+        pass
+
+    if not match_tables:
+        driver = lazy_driver.get()
+        driver.get(schedule_url)
+        time.sleep(1)
+        match_tables = BeautifulSoup(driver.page_source, "lxml").find_all("table")
+
+    return store_sidearm_calendar(conference_base_url, match_tables, season)
+
+
+def store_sidearm_calendar(conference_base_url: str, match_tables: list,
+                           season: int | None = None) -> list[tuple[str, str, str, str]]:
+    """
+    Parses a Sidearm conference calendar and replaces the cached copy of the season, so later lookups see results
+    posted since the calendar was first fetched.
+
+    Args:
+        conference_base_url: The base URL of the conference website.
+        match_tables: List of match table elements of the calendar page.
+        season: The season of the calendar, defaults to the current year.
+
+    Returns:
+        List of match data represented as a tuple of the form (home_team, away_team, date, box_score_url).
+    """
+    matches = extract_all_matches(conference_base_url, match_tables)
+    sidearm_calendar_cache[(conference_base_url, season or datetime.now().year)] = matches
+
+    return matches
 
 
 def extract_matches(team_data: dict, match_tables: list) -> list[tuple[str, str, str, str]]:
@@ -112,26 +451,41 @@ def extract_matches(team_data: dict, match_tables: list) -> list[tuple[str, str,
         team_data: Dictionary containing team data.
         match_tables: List of match table elements.
 
+    Returns:
+        List of match data represented as a tuple of the form (home_team, away_team, date, box_score_url).
+    """
+    matches = extract_all_matches(team_data["conference_base_url"], match_tables)
+    return [match for match in matches if team_data["name"] in (match[0], match[1])]
+
+
+@measure(PARSE_SECONDS, parser="box_scores")
+def extract_all_matches(conference_base_url: str, match_tables: list) -> list[tuple[str, str, str, str]]:
+    """Extract every match with a box score from the match tables, regardless of the teams playing.
+
+    Args:
+        conference_base_url: The base URL of the conference website.
+        match_tables: List of match table elements.
+
     Returns:
         List of match data represented as a tuple of the form (home_team, away_team, date, box_score_url).
     """
     matches = []
     for match_table in match_tables:
         match_table_body = match_table.find("tbody")
+        if not match_table_body:
+            continue
 
         for tr in match_table_body.find_all("tr"):
-            away_team = get_team_name(tr, 'sidearm-team-away')
-            home_team = get_team_name(tr, 'sidearm-team-home')
-
-            if (away_team != team_data["name"]) and (home_team != team_data["name"]):
+            anchor = tr.find("a", string="Box Score")
+            if not anchor:
                 continue
 
+            away_team = get_team_name(tr, 'sidearm-team-away')
+            home_team = get_team_name(tr, 'sidearm-team-home')
             date = extract_match_date(match_table)
 
-            anchor = tr.find("a", string="Box Score")
-            if anchor:
-                box_score_href = team_data["conference_base_url"] + anchor["href"]
-                matches.append((home_team, away_team, date, box_score_href))
+            box_score_href = conference_base_url + anchor["href"]
+            matches.append((home_team, away_team, date, box_score_href))
 
     return matches
 
@@ -209,3 +563,74 @@ def fetch_pdf_urls_for_matches(driver: webdriver.Chrome, matches: list[tuple[str
             print_failure_message(f"{match[0]} vs. {match[1]} {match[2]}.pdf", e.msg)
 
     return match_data
+
+
+def resolve_sidearm_pdf_urls(lazy_driver: LazyWebDriver, matches: list[tuple[str, str, str, str]],
+                             team_data: dict, count: int) -> list[tuple[str, str, str, str]]:
+    """
+    Resolve the PDF URLs for box scores of the given matches concurrently over plain HTTP. Matches that cannot be
+    resolved without the browser fall back to fetch_pdf_urls_for_matches.
+
+    Args:
+        lazy_driver: The web driver, only launched if a match cannot be resolved over plain HTTP.
+        matches: List of matches containing details.
+        team_data: Dictionary containing team data.
+        count: The number of box scores to fetch.
+
+    Returns:
+        List of match data represented as a tuple of the form (home_team, away_team, date, box_score_pdf_url).
+    """
+    selected_matches = matches[-count:]
+    if not selected_matches:
+        return []
+
+    with create_http_session() as session, ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        pdf_urls = list(executor.map(
+            lambda match: fetch_pdf_url_over_http(session, match, team_data["conference_base_url"]),
+            selected_matches
+        ))
+
+    pdf_urls_by_match = {match[:3]: pdf_url for match, pdf_url in zip(selected_matches, pdf_urls) if pdf_url}
+
+    unresolved_matches = [match for match in selected_matches if match[:3] not in pdf_urls_by_match]
+    if unresolved_matches:
+        browser_match_data = fetch_pdf_urls_for_matches(lazy_driver.get(), unresolved_matches, team_data,
+                                                        len(unresolved_matches))
+        for home_team, away_team, date, box_score_pdf_url in browser_match_data:
+            pdf_urls_by_match[(home_team, away_team, date)] = box_score_pdf_url
+
+    return [(match[0], match[1], match[2], pdf_urls_by_match[match[:3]]) for match in selected_matches
+            if match[:3] in pdf_urls_by_match]
+
+
+def fetch_pdf_url_over_http(session: requests.Session, match: tuple[str, str, str, str],
+                            conference_base_url: str) -> str | None:
+    """
+    Follow a match's box score page to its PDF over plain HTTP, without the browser.
+
+    Args:
+        session: The HTTP session to send requests with.
+        match: Match data represented as a tuple of the form (home_team, away_team, date, box_score_url).
+        conference_base_url: The base URL of the conference website.
+
+    Returns:
+        The box score PDF URL. None is returned if the pages need the browser to render.
+    """
+    try:
+        response = session.get(match[3], timeout=HTTP_TIMEOUT)
+        if not response.ok:
+            return None
+
+        print_bar = BeautifulSoup(response.text, "lxml").find("div", id="print-bar")
+        anchor = print_bar.find("a") if print_bar else None
+        if not anchor:
+            return None
+
+        response = session.get(conference_base_url + anchor["href"], timeout=HTTP_TIMEOUT)
+        if not response.ok:
+            return None
+
+        object_tag = BeautifulSoup(response.text, "lxml").find("object")
+        return object_tag["data"] if (object_tag and object_tag.get("data")) else None
+    except requests.RequestException:
+        return None
@@ -0,0 +1,348 @@
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+import requests
+from selenium import webdriver
+from selenium.common import WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+import metrics
+
+STATE_DIR = Path(__file__).parent.absolute() / ".cache"
+BROWSER_STATE_PATH = STATE_DIR / "browser.json"
+BROWSER_LOCK_PATH = STATE_DIR / "browser.lock"
+
+STARTUP_TIMEOUT = 30
+HEALTH_CHECK_TIMEOUT = 2
+LOCK_STALE_SECONDS = 60
+ATTACH_ATTEMPTS = 2
+
+CHROME_EXECUTABLES = [
+    "google-chrome",
+    "google-chrome-stable",
+    "chromium",
+    "chromium-browser",
+    "chrome",
+    "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+    r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+    r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
+]
+
+CHROME_ARGUMENTS = [
+    "--headless=new",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-blink-features=AutomationControlled",
+    "--disable-infobars",
+    "--disable-notifications",
+    "--disable-popup-blocking",
+    "--disable-software-rasterizer",
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--remote-debugging-address=127.0.0.1",
+    "--remote-debugging-port=0",
+]
+
+enabled = False
+
+
+class AttachedChrome(webdriver.Chrome):
+    """
+    Web driver attached to the persistent browser. Each driver works in its own tab, which is closed when the driver
+    quits while the browser keeps running for later invocations.
+    """
+
+    def quit(self) -> None:
+        try:
+            self.close()
+        except WebDriverException:
+            pass
+
+        super().quit()
+
+
+def attach_web_driver() -> webdriver.Chrome:
+    """
+    Attaches a new web driver to the persistent browser, launching the browser first if it is not running. If
+    attaching fails, the cached chromedriver path is dropped, as it may no longer match the installed Chrome, and the
+    browser is attached to again, after being relaunched if it died.
+
+    Returns:
+        A new web driver instance working in a new tab.
+    """
+    for attempt in range(ATTACH_ATTEMPTS):
+        debugger_address = get_browser_endpoint()
+
+        chrome_options = Options()
+        chrome_options.add_experimental_option("debuggerAddress", debugger_address)
+        service = Service(get_chromedriver_path(), connect_timeout=30)
+
+        try:
+            driver = AttachedChrome(service=service, options=chrome_options)
+            driver.switch_to.new_window("tab")
+
+            driver.set_page_load_timeout(30)
+            driver.set_script_timeout(20)
+            driver.implicitly_wait(10)
+
+            return driver
+        except WebDriverException as e:
+            service.stop()
+            forget_chromedriver_path()
+            if attempt == ATTACH_ATTEMPTS - 1:
+                raise RuntimeError(f"Failed to attach to the browser at {debugger_address}: {e.msg}")
+
+
+def get_browser_endpoint() -> str:
+    """
+    Returns the debugger address of the persistent browser recorded in the state file, launching a new browser if
+    none is recorded or the recorded one no longer answers.
+
+    Returns:
+        The debugger address of the browser, of the form host:port.
+    """
+    with browser_lock():
+        state = load_browser_state()
+
+        debugger_address = state.get("debugger_address")
+        if debugger_address and is_browser_alive(debugger_address):
+            return debugger_address
+
+        previous_profile_dir = state.get("profile_dir")
+        state.update(launch_browser())
+        if debugger_address:
+            metrics.DRIVER_RESTARTS.inc()
+        save_browser_state(state)
+
+        if previous_profile_dir:
+            shutil.rmtree(previous_profile_dir, ignore_errors=True)
+
+        return state["debugger_address"]
+
+
+def launch_browser() -> dict:
+    """
+    Launches headless Chrome detached from this process, so it outlives the invocation that started it. Chrome picks
+    a free debugging port and writes it to its profile directory.
+
+    Returns:
+        Dictionary describing the browser (pid, debugger_address, profile_dir, started_at).
+    """
+    chrome_path = find_chrome()
+    if chrome_path is None:
+        raise RuntimeError("Chrome is not installed")
+
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    profile_dir = tempfile.mkdtemp(dir=STATE_DIR, prefix="browser-profile-")
+
+    process = subprocess.Popen(
+        [chrome_path, *CHROME_ARGUMENTS, f"--user-data-dir={profile_dir}", "about:blank"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        creationflags=subprocess.DETACHED_PROCESS if sys.platform == "win32" else 0
+    )
+    metrics.DRIVER_LAUNCHES.inc()
+
+    port_path = Path(profile_dir) / "DevToolsActivePort"
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Chrome exited with code {process.returncode}")
+
+        if port_path.exists():
+            port = port_path.read_text().split("\n")[0].strip()
+            if port and is_browser_alive(f"127.0.0.1:{port}"):
+                return {
+                    "pid": process.pid,
+                    "debugger_address": f"127.0.0.1:{port}",
+                    "profile_dir": profile_dir,
+                    "started_at": datetime.now().isoformat(timespec="seconds")
+                }
+
+        time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError("Timed out waiting for Chrome to start")
+
+
+def stop_browser() -> str | None:
+    """
+    Stops the persistent browser recorded in the state file, if it is still running.
+
+    Returns:
+        The debugger address of the stopped browser. None is returned if no browser was running.
+    """
+    with browser_lock():
+        state = load_browser_state()
+
+        debugger_address = state.pop("debugger_address", None)
+        pid = state.pop("pid", None)
+        profile_dir = state.pop("profile_dir", None)
+        state.pop("started_at", None)
+        save_browser_state(state)
+
+        is_running = bool(debugger_address and pid and is_browser_alive(debugger_address))
+        if is_running:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    if profile_dir:
+        if is_running:
+            time.sleep(1)
+        shutil.rmtree(profile_dir, ignore_errors=True)
+
+    return debugger_address if is_running else None
+
+
+def is_browser_alive(debugger_address: str) -> bool:
+    """
+    Checks that a browser answers on its debugger address.
+
+    Args:
+        debugger_address: The debugger address of the browser, of the form host:port.
+
+    Returns:
+        True if the browser answered, False otherwise.
+    """
+    try:
+        return requests.get(f"http://{debugger_address}/json/version", timeout=HEALTH_CHECK_TIMEOUT).ok
+    except requests.RequestException:
+        return False
+
+
+def find_chrome() -> str | None:
+    """
+    Finds the Chrome executable.
+
+    Returns:
+        The path of the executable. None is returned if Chrome is not installed.
+    """
+    for executable in CHROME_EXECUTABLES:
+        chrome_path = shutil.which(executable) or (executable if os.path.isfile(executable) else None)
+        if chrome_path:
+            return chrome_path
+
+    return None
+
+
+def get_chromedriver_path() -> str:
+    """
+    Returns the path of chromedriver, only asking ChromeDriverManager to resolve it if no cached path exists.
+
+    Returns:
+        The path of the chromedriver executable.
+    """
+    state = load_browser_state()
+
+    chromedriver_path = state.get("chromedriver_path")
+    if chromedriver_path and os.path.exists(chromedriver_path):
+        return chromedriver_path
+
+    chromedriver_path = ChromeDriverManager().install()
+    with browser_lock():
+        state = load_browser_state()
+        state["chromedriver_path"] = chromedriver_path
+        save_browser_state(state)
+
+    return chromedriver_path
+
+
+def forget_chromedriver_path() -> None:
+    """
+    Removes the cached chromedriver path, so the next launch resolves it again. Used when the cached chromedriver no
+    longer matches the installed Chrome.
+
+    Returns:
+        None
+    """
+    with browser_lock():
+        state = load_browser_state()
+        state.pop("chromedriver_path", None)
+        save_browser_state(state)
+
+
+@contextmanager
+def browser_lock() -> Iterator[None]:
+    """
+    Holds a lock file while the state file is read and updated, so concurrent invocations never launch two browsers.
+    A lock left behind by a crashed invocation is broken once it is older than LOCK_STALE_SECONDS.
+
+    Returns:
+        Iterator yielding once the lock is held.
+    """
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    deadline = time.time() + LOCK_STALE_SECONDS
+
+    while True:
+        try:
+            os.close(os.open(BROWSER_LOCK_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(BROWSER_LOCK_PATH) > LOCK_STALE_SECONDS:
+                    os.remove(BROWSER_LOCK_PATH)
+                    continue
+            except FileNotFoundError:
+                continue
+
+            if time.time() > deadline:
+                raise RuntimeError("Timed out waiting for the browser state lock")
+            time.sleep(0.05)
+
+    try:
+        yield
+    finally:
+        try:
+            os.remove(BROWSER_LOCK_PATH)
+        except FileNotFoundError:
+            pass
+
+
+def load_browser_state() -> dict:
+    """
+    Loads the state file describing the persistent browser and the cached chromedriver path.
+
+    Returns:
+        Dictionary holding the browser state.
+    """
+    if not BROWSER_STATE_PATH.exists():
+        return {}
+
+    with open(BROWSER_STATE_PATH, "r") as file:
+        return json.load(file)
+
+
+def save_browser_state(state: dict) -> None:
+    """
+    Saves the state file describing the persistent browser and the cached chromedriver path.
+
+    Args:
+        state: Dictionary holding the browser state.
+
+    Returns:
+        None
+    """
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    partial_path = BROWSER_STATE_PATH.with_suffix(".json.part")
+    with open(partial_path, "w") as file:
+        json.dump(state, file, indent=2)
+    os.replace(partial_path, BROWSER_STATE_PATH)
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import threading
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.errors import PdfReadError
+
+from utils import register_output_hook, unregister_output_hook, print_success_message, print_failure_message
+
+PDF_BUNDLE_SAVE_INTERVAL = 25
+
+
+class ZipBundle:
+    """
+    Collects a team's files into a single ZIP archive with a JSON manifest. Each file is written into the archive as
+    soon as it has been written, and the originals are only removed once the archive is complete, so a run that is
+    killed before the bundle is closed keeps its files.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.manifest = []
+        self.added_paths = []
+        self.lock = threading.Lock()
+        self.archive = zipfile.ZipFile(os.getcwd() + "/" + filename, "w", compression=zipfile.ZIP_DEFLATED)
+
+    def add(self, path: str, metadata: dict) -> None:
+        """
+        Writes a completed file into the archive, filed under its category.
+
+        Args:
+            path: Path of the completed file.
+            metadata: Dictionary describing the file (team, category, season, source_url).
+
+        Returns:
+            None
+        """
+        category = metadata.get("category", "Other")
+        arcname = f"{category}/{Path(path).name}"
+
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                sha256.update(chunk)
+
+        with self.lock:
+            self.archive.write(path, arcname)
+            self.manifest.append({
+                "path": arcname,
+                "size": os.path.getsize(path),
+                "sha256": sha256.hexdigest(),
+                "added_at": datetime.now().isoformat(timespec="seconds"),
+                **metadata
+            })
+            self.added_paths.append(path)
+
+    def close(self) -> None:
+        """
+        Writes the manifest, closes the archive and removes the files added to it.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.archive.writestr("manifest.json", json.dumps(self.manifest, indent=2))
+            self.archive.close()
+
+        remove_files(self.added_paths)
+
+
+class PdfBundle:
+    """
+    Collects a team's files into a single PDF with one bookmark per category and per file. Only the paths of the
+    files are held while the bundle is open, and the combined document is built from them every
+    PDF_BUNDLE_SAVE_INTERVAL files and when the bundle is closed. The originals are only removed once the final
+    document has been saved, so a run that is killed before the bundle is closed keeps its files.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.entries: dict[str, str] = {}
+        self.unsaved_count = 0
+
+    def add(self, path: str, metadata: dict) -> None:
+        """
+        Adds a completed file to the bundle, bookmarked under the file's category. A file written again replaces
+        its earlier version. Files other than PDFs, such as extracted article text, and files that cannot be read as
+        PDFs are left out.
+
+        Args:
+            path: Path of the completed file.
+            metadata: Dictionary describing the file (team, category, season, source_url).
+
+        Returns:
+            None
+        """
+        if not path.endswith(".pdf"):
+            return
+
+        try:
+            len(PdfReader(path).pages)
+        except PdfReadError as e:
+            print_failure_message(Path(path).name, f"Not a valid PDF, left out of the bundle: {e}")
+            return
+
+        with self.lock:
+            self.entries.pop(path, None)
+            self.entries[path] = metadata.get("category", "Other")
+            self.unsaved_count += 1
+
+            if self.unsaved_count >= PDF_BUNDLE_SAVE_INTERVAL:
+                self.save()
+
+    def save(self) -> None:
+        """
+        Builds the combined document from the added files and replaces the bundle file atomically. Must be called
+        with the lock held.
+
+        Returns:
+            None
+        """
+        writer = PdfWriter()
+        category_bookmarks = {}
+
+        for path, category in self.entries.items():
+            first_page = len(writer.pages)
+            try:
+                writer.append(path, import_outline=False)
+            except (OSError, PdfReadError) as e:
+                print_failure_message(Path(path).name, f"Could not be added to the bundle: {e}")
+                continue
+
+            if category not in category_bookmarks:
+                category_bookmarks[category] = writer.add_outline_item(category, first_page)
+
+            writer.add_outline_item(Path(path).stem, first_page, parent=category_bookmarks[category])
+
+        writer.add_metadata({"/Title": Path(self.filename).stem})
+
+        bundle_path = os.getcwd() + "/" + self.filename
+        with open(bundle_path + ".part", "wb") as file:
+            writer.write(file)
+        writer.close()
+        os.replace(bundle_path + ".part", bundle_path)
+
+        self.unsaved_count = 0
+
+    def close(self) -> None:
+        """
+        Saves the combined document and removes the files added to it.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.save()
+
+        remove_files(list(self.entries))
+
+
+def remove_files(paths: list[str]) -> None:
+    """
+    Removes files that have been saved into a bundle.
+
+    Args:
+        paths: Paths of the files.
+
+    Returns:
+        None
+    """
+    for path in dict.fromkeys(paths):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def bundle_output(bundle_format: str, team_data: dict) -> Iterator[ZipBundle | PdfBundle]:
+    """
+    Routes every file of the team written while the context is active into a single bundle file.
+
+    Args:
+        bundle_format: Either "pdf" or "zip".
+        team_data: Dictionary containing team data.
+
+    Returns:
+        Iterator yielding the active bundle.
+    """
+    filename = f"{team_data['abbreviation']} Bundle.{bundle_format}"
+    bundle = ZipBundle(filename) if bundle_format == "zip" else PdfBundle(filename)
+
+    def add_team_file(path: str, metadata: dict) -> None:
+        if metadata.get("team", team_data["name"]) == team_data["name"]:
+            bundle.add(path, metadata)
+
+    register_output_hook(add_team_file)
+    try:
+        yield bundle
+    finally:
+        unregister_output_hook(add_team_file)
+        bundle.close()
+        print_success_message(filename)
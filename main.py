@@ -10,18 +10,33 @@ if str(script_dir) not in sys.path:
     sys.path.insert(0, str(script_dir))
 
 import argparse
+import atexit
 import json
+from contextlib import ExitStack
 from datetime import datetime
 
 import pandas as pd
 
-from articles import fetch_articles, download_articles
-from box_scores import download_box_scores
-from roster import download_roster
+import browser_endpoint
+from archive import start_recording, start_replay, PageArchive
+from articles import fetch_articles, download_articles, extract_articles, ARTICLE_FORMATS
+from box_scores import download_box_scores, download_conference_box_scores
+from renderers import RENDERERS, close_renderers
+from bundle import bundle_output
+from metrics import write_textfile, serve_metrics
+from postprocess import optimize_output
+from roster import download_roster, fetch_roster_records, save_roster_records, load_roster_index, \
+    reparse_roster_history
 from schedule import download_schedule
-from stats import download_stats
-from utils import prompt_user_for_articles, validate_articles_argument, validate_box_scores_argument, NORMAL, GREEN, \
-    BOLD
+from stats import download_stats_for_teams
+from watch import watch_teams
+from work_queue import WorkQueue, plan_units, select_shard, run_units, run_worker
+from utils import prompt_user_for_articles, validate_articles_argument, validate_box_scores_argument, \
+    validate_stats_argument, validate_player_filters_argument, validate_shard_argument, validate_replay_at_argument, \
+    wait_for_output_hooks, NORMAL, GREEN, BOLD
+
+ROSTER_RECORDS_FILENAME = "Rosters.parquet"
+ROSTER_HISTORY_FILENAME = "Roster History.parquet"
 
 
 def main():
@@ -31,9 +46,9 @@ def main():
         teams = json.load(file)
 
     parser.add_argument("-n", "--name",
+                        nargs="+",
                         choices=list(teams.keys()),
-                        required=True,
-                        help="Accepts a team name (e.g., -n Northwestern)")
+                        help="Accepts 1 or more team names (e.g., -n Northwestern or -n Northwestern Indiana)")
     parser.add_argument("-r", "--roster",
                         action="store_true",
                         help="Determines whether or not the schedule is downloaded (e.g., -r)")
@@ -51,36 +66,257 @@ def main():
     parser.add_argument("-a", "--articles",
                         nargs="+",
                         help="Accepts 1 or 2 dates (e.g., -a 12/12/2024 or -a 12/12/2024 05/01/2025)")
+    parser.add_argument("--article-format",
+                        choices=ARTICLE_FORMATS,
+                        default="pdf",
+                        help="Saves articles as printed PDFs or as extracted Markdown or JSON text (e.g., -a 12/12/2024 --article-format markdown)")
+    parser.add_argument("--conference",
+                        action="store_true",
+                        help="Downloads box scores for every team in the selected teams' conferences, one folder per team (e.g., -b 5 --conference)")
+    parser.add_argument("--watch",
+                        action="store_true",
+                        help="Keeps checking the schedules and downloads box scores, stats and articles as soon as new results are posted (e.g., --watch)")
+    parser.add_argument("--queue",
+                        help="Accepts the path of a SQLite work queue shared by several workers (e.g., --queue /mnt/shared/queue.db)")
+    parser.add_argument("--plan",
+                        action="store_true",
+                        help="Adds the requested downloads to the work queue instead of running them (e.g., --queue queue.db --plan)")
+    parser.add_argument("--work",
+                        action="store_true",
+                        help="Runs downloads from the work queue until it is empty (e.g., --queue queue.db --work)")
+    parser.add_argument("--shard",
+                        help="Accepts a shard i/N and only runs that part of the requested downloads (e.g., --shard 0/4)")
+    parser.add_argument("--renderer",
+                        choices=list(RENDERERS.keys()),
+                        help="Renders rosters and schedules with the given backend instead of each team's default (e.g., --renderer wkhtmltopdf)")
+    archive_group = parser.add_mutually_exclusive_group()
+    archive_group.add_argument("--archive",
+                               help="Accepts a directory in which every fetched page is archived (e.g., --archive pages)")
+    archive_group.add_argument("--replay",
+                               help="Accepts a directory of archived pages to serve instead of the network (e.g., --replay pages)")
+    parser.add_argument("--replay-run",
+                        help="Only replays the pages archived by the given run (e.g., --replay pages --replay-run 20241005-180000-4242)")
+    parser.add_argument("--replay-at",
+                        help="Only replays the pages archived at or before the given time (e.g., --replay pages --replay-at 2024-10-05T18:00)")
+    parser.add_argument("--list-runs",
+                        action="store_true",
+                        help="Lists the runs recorded in the archive given with --archive or --replay (e.g., --replay pages --list-runs)")
+    parser.add_argument("--roster-history",
+                        help=f"Accepts an archive directory and re-parses every archived roster page into {ROSTER_HISTORY_FILENAME} (e.g., --roster-history pages)")
+    parser.add_argument("--persistent-browser",
+                        action="store_true",
+                        help="Attaches to a long-lived headless browser kept running between runs, starting it if needed (e.g., -r --persistent-browser)")
+    parser.add_argument("--stop-browser",
+                        action="store_true",
+                        help="Stops the long-lived headless browser (e.g., --stop-browser)")
+    parser.add_argument("--bundle",
+                        choices=["pdf", "zip"],
+                        help="Combines all downloaded files into one PDF with bookmarks or one ZIP with a manifest (e.g., --bundle zip)")
+    parser.add_argument("--optimize",
+                        action="store_true",
+                        help="Downsamples images, linearizes and stamps metadata into every downloaded PDF (e.g., --optimize)")
+    parser.add_argument("--metrics",
+                        help="Accepts the path of an OpenMetrics file written with the run's metrics when it ends (e.g., --metrics scraper.prom)")
+    parser.add_argument("--metrics-port",
+                        type=int,
+                        help="Accepts a port on which the run's metrics are served live at /metrics (e.g., --watch --metrics-port 9108)")
+    parser.add_argument("--metrics-host",
+                        default="127.0.0.1",
+                        help="Accepts the address the live metrics are served on, 127.0.0.1 by default (e.g., --metrics-host 0.0.0.0)")
+    parser.add_argument("--roster-records",
+                        action="store_true",
+                        help=f"Parses the rosters of every team into {ROSTER_RECORDS_FILENAME} (e.g., --roster-records)")
+    parser.add_argument("--find-players",
+                        nargs="+",
+                        help="Accepts 1 or more KEY=VALUE filters to search the roster records (e.g., --find-players position=GK state=Illinois)")
 
     args = parser.parse_args()
 
+    if ((args.replay_run is not None) or (args.replay_at is not None)) and (args.replay is None):
+        parser.error("the following arguments are required with --replay-run or --replay-at: --replay")
+
+    if args.replay_at is not None:
+        try:
+            args.replay_at = validate_replay_at_argument(args.replay_at)
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+
+    for archive_directory in [args.replay, args.roster_history]:
+        if (archive_directory is not None) and not os.path.isdir(archive_directory):
+            parser.error(f"archive directory \"{archive_directory}\" does not exist")
+
+    if args.list_runs:
+        if (args.archive or args.replay) is None:
+            parser.error("the following arguments are required with --list-runs: --archive or --replay")
+
+        for run, summary in PageArchive(args.archive or args.replay).runs().items():
+            print(f"{BOLD}{GREEN}[RUN]{NORMAL} {run or '(no run id)'}: {summary['pages']} page(s) archived from "
+                  f"{summary['first']} to {summary['last']}")
+        return
+
+    if args.archive is not None:
+        start_recording(args.archive)
+    elif args.replay is not None:
+        if (args.replay_run is not None) and (args.replay_run not in PageArchive(args.replay).runs()):
+            parser.error(f"argument --replay-run: no run \"{args.replay_run}\" in \"{args.replay}\"")
+
+        start_replay(args.replay, args.replay_run, args.replay_at)
+
+    if args.stop_browser:
+        debugger_address = browser_endpoint.stop_browser()
+        if debugger_address is not None:
+            print(f"{BOLD}{GREEN}[BROWSER]{NORMAL} Stopped the persistent browser at {debugger_address}")
+        return
+
+    browser_endpoint.enabled = args.persistent_browser
+
+    if args.metrics is not None:
+        atexit.register(write_textfile, args.metrics)
+
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_port, args.metrics_host)
+
     if hasattr(args, 'box_scores') and args.box_scores is not None:
         try:
             args.box_scores = validate_box_scores_argument(args.box_scores)
         except argparse.ArgumentTypeError as e:
             parser.error(str(e))
 
+    if hasattr(args, 'stats') and args.stats is not None:
+        try:
+            args.stats = validate_stats_argument(args.stats)
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+
     if hasattr(args, 'articles') and args.articles is not None:
         try:
             args.articles = validate_articles_argument(args.articles)
         except argparse.ArgumentTypeError as e:
             parser.error(str(e))
 
-    team_data = teams[args.name]
+    if hasattr(args, 'find_players') and args.find_players is not None:
+        try:
+            args.find_players = validate_player_filters_argument(args.find_players)
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+
+    if hasattr(args, 'shard') and args.shard is not None:
+        try:
+            args.shard = validate_shard_argument(args.shard)
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+
+    if (args.plan or args.work) and (args.queue is None):
+        parser.error("the following arguments are required with --plan or --work: --queue")
+
+    if (args.plan or args.work or (args.shard is not None)) and args.bundle:
+        parser.error("argument --bundle: not allowed with --plan, --work or --shard, as every process would write its "
+                     "own partial bundle")
+
+    if args.work and (args.renderer or args.optimize or args.conference or (args.article_format != "pdf")):
+        parser.error("arguments --renderer, --article-format, --optimize and --conference: set with --plan, not "
+                     "with --work")
+
+    if args.work:
+        run_worker(teams, WorkQueue(args.queue))
+        return
+
+    if args.plan or (args.shard is not None):
+        teams_data = [teams[name] for name in dict.fromkeys(args.name)] if args.name else list(teams.values())
+        years = None
+        if args.stats is not None:
+            years = args.stats if len(args.stats) > 0 else [str(datetime.now().year), str(datetime.now().year - 1)]
+
+        units = plan_units(teams_data, args.roster, args.schedule, years, args.box_scores, args.articles,
+                           args.conference)
+        run_options = {"renderer": args.renderer, "article_format": args.article_format, "optimize": args.optimize}
+
+        if args.plan:
+            added_units = WorkQueue(args.queue).enqueue(units, run_options)
+            print(f"{BOLD}{GREEN}[QUEUE]{NORMAL} Added {added_units} of {len(units)} planned units to {args.queue}")
+        else:
+            run_units(teams, select_shard(units, *args.shard), run_options)
+        return
+
+    if args.roster_history is not None:
+        history_teams = {name: teams[name] for name in dict.fromkeys(args.name)} if args.name else teams
+        save_roster_records(reparse_roster_history(history_teams, PageArchive(args.roster_history)),
+                            ROSTER_HISTORY_FILENAME)
+        return
+
+    if (args.name is None) and (not args.roster_records) and (args.find_players is None):
+        parser.error("the following arguments are required: -n/--name")
+
+    if args.roster_records or ((args.find_players is not None) and not os.path.exists(ROSTER_RECORDS_FILENAME)):
+        save_roster_records(fetch_roster_records(teams), ROSTER_RECORDS_FILENAME)
+
+    if args.find_players is not None:
+        players = load_roster_index(ROSTER_RECORDS_FILENAME).query(**args.find_players)
+        with pd.option_context('display.max_rows', None, 'display.width', None):
+            print(players.to_string(index=False))
+
+    if args.name is None:
+        return
+
+    teams_data = [teams[name] for name in dict.fromkeys(args.name)]
+
+    with ExitStack() as stack:
+        if args.optimize:
+            stack.enter_context(optimize_output())
+
+        if args.bundle:
+            for team_data in teams_data:
+                stack.enter_context(bundle_output(args.bundle, team_data))
+
+        stack.callback(wait_for_output_hooks)
+        stack.callback(close_renderers)
+
+        for team_data in teams_data:
+            download_team_data(args, team_data)
+
+        if (args.box_scores is not None) and args.conference:
+            conference_base_urls = {team_data["conference_base_url"] for team_data in teams_data}
+            conference_teams = [team_data for team_data in teams.values()
+                                if team_data["conference_base_url"] in conference_base_urls]
+            download_conference_box_scores(conference_teams, args.box_scores)
+
+        if args.stats is not None:
+            years = args.stats if len(args.stats) > 0 else [str(datetime.now().year), str(datetime.now().year - 1)]
+            download_stats_for_teams(teams_data, years)
+
+        if args.watch:
+            try:
+                watch_teams(teams_data, args.article_format)
+            except KeyboardInterrupt:
+                pass
+
+    print(f"{BOLD}{GREEN}[DONE]{NORMAL} Finished downloading files to {os.getcwd()}")
+
+
+def download_team_data(args: argparse.Namespace, team_data: dict) -> None:
+    """
+    Downloads every category of files requested on the command line for a team.
+
+    Args:
+        args: Parsed command line arguments.
+        team_data: Dictionary containing team data.
+
+    Returns:
+        None
+    """
+    renderer = args.renderer or team_data.get("renderer", "chrome")
 
     if args.roster:
         filename = f"{team_data['abbreviation']} Roster.pdf"
-        download_roster(team_data["roster_url"], filename)
+        download_roster(team_data["roster_url"], filename, {"team": team_data["name"], "category": "Roster"},
+                        renderer)
 
     if args.schedule:
         filename = f"{team_data["abbreviation"]} Schedule.pdf"
-        download_schedule(team_data["name"], team_data["schedule_url"], filename)
-
-    if args.stats is not None:
-        stats = args.stats if len(args.stats) > 0 else [str(datetime.now().year), str(datetime.now().year - 1)]
-        download_stats(team_data, stats)
+        download_schedule(team_data["name"], team_data["schedule_url"], filename,
+                          {"team": team_data["name"], "category": "Schedule"}, renderer)
 
-    if args.box_scores is not None:
+    if (args.box_scores is not None) and (not args.conference):
         download_box_scores(team_data, args.box_scores)
 
     if args.articles is not None:
@@ -91,9 +327,10 @@ def main():
         article_indexes = prompt_user_for_articles(len(fetched_articles) - 1)
         filtered_articles = fetched_articles.iloc[article_indexes]
 
-        download_articles(filtered_articles)
-
-    print(f"{BOLD}{GREEN}[DONE]{NORMAL} Finished downloading files to {os.getcwd()}")
+        if args.article_format == "pdf":
+            download_articles(filtered_articles, {"team": team_data["name"]})
+        else:
+            extract_articles(filtered_articles, args.article_format, {"team": team_data["name"]})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,321 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+from urllib.parse import urlparse
+
+from selenium.webdriver.support.events import AbstractEventListener
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+metric_families = []
+
+
+class Counter:
+    """
+    Thread-safe OpenMetrics counter with one value per combination of label values.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: list[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.lock = threading.Lock()
+        self.values: dict[tuple, float] = {}
+        metric_families.append(self)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """
+        Increases the counter of the given label values.
+
+        Args:
+            amount: The amount to increase the counter by.
+            **labels: The value of each label.
+
+        Returns:
+            None
+        """
+        key = tuple(str(labels.get(label_name, "")) for label_name in self.label_names)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self) -> float:
+        """
+        Sums the counter over every combination of label values.
+
+        Returns:
+            The total count.
+        """
+        with self.lock:
+            return sum(self.values.values())
+
+    def samples(self) -> Iterator[tuple[str, dict, float]]:
+        """
+        Lists the samples of the counter.
+
+        Returns:
+            Iterator of samples represented as a tuple of the form (name, labels, value).
+        """
+        with self.lock:
+            values = dict(self.values)
+
+        for key, value in values.items():
+            yield f"{self.name}_total", dict(zip(self.label_names, key)), value
+
+
+class Histogram:
+    """
+    Thread-safe OpenMetrics histogram with one set of buckets per combination of label values.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: list[str], buckets: list[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.values: dict[tuple, tuple[list[int], float]] = {}
+        metric_families.append(self)
+
+    def observe(self, value: float, **labels) -> None:
+        """
+        Records an observation for the given label values.
+
+        Args:
+            value: The observed value.
+            **labels: The value of each label.
+
+        Returns:
+            None
+        """
+        key = tuple(str(labels.get(label_name, "")) for label_name in self.label_names)
+        with self.lock:
+            bucket_counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucket_counts[index] += 1
+            bucket_counts[-1] += 1
+            self.values[key] = (bucket_counts, total + value)
+
+    def samples(self) -> Iterator[tuple[str, dict, float]]:
+        """
+        Lists the samples of the histogram, with cumulative buckets.
+
+        Returns:
+            Iterator of samples represented as a tuple of the form (name, labels, value).
+        """
+        with self.lock:
+            values = {key: (list(bucket_counts), total) for key, (bucket_counts, total) in self.values.items()}
+
+        for key, (bucket_counts, total) in values.items():
+            labels = dict(zip(self.label_names, key))
+            for bound, count in zip([*map(float, self.buckets), "+Inf"], bucket_counts):
+                yield f"{self.name}_bucket", {**labels, "le": str(bound)}, count
+            yield f"{self.name}_count", labels, bucket_counts[-1]
+            yield f"{self.name}_sum", labels, total
+
+
+PAGES = Counter("scraper_pages", "Pages fetched, over HTTP or with the browser.", ["host", "kind"])
+FILES = Counter("scraper_files", "Files written to the output directory.", ["team", "host", "category"])
+FILE_BYTES = Counter("scraper_file_bytes", "Bytes written to the output directory.", ["team", "host", "category"])
+FAILURES = Counter("scraper_failures", "Downloads that failed.", [])
+DRIVER_LAUNCHES = Counter("scraper_driver_launches", "Browsers launched.", [])
+DRIVER_RESTARTS = Counter("scraper_driver_restarts", "Persistent browsers relaunched after they stopped answering.", [])
+CACHE_LOOKUPS = Counter("scraper_cache_lookups", "Cache lookups, by cache and result (hit or miss).",
+                        ["cache", "result"])
+NAVIGATION_SECONDS = Histogram("scraper_navigation_seconds", "Time taken to load a page.", ["host", "kind"])
+PARSE_SECONDS = Histogram("scraper_parse_seconds", "Time taken to parse a page.", ["parser"])
+RENDER_SECONDS = Histogram("scraper_render_seconds", "Time taken to render a PDF file.", ["renderer", "host"])
+
+
+class NavigationListener(AbstractEventListener):
+    """
+    Web driver event listener that counts and times page loads.
+    """
+
+    def __init__(self):
+        self.navigation_start = 0.0
+
+    def before_navigate_to(self, url, driver) -> None:
+        self.navigation_start = time.perf_counter()
+
+    def after_navigate_to(self, url, driver) -> None:
+        host = get_host(url)
+        PAGES.inc(host=host, kind="browser")
+        NAVIGATION_SECONDS.observe(time.perf_counter() - self.navigation_start, host=host, kind="browser")
+
+
+@contextmanager
+def measure(histogram: Histogram, **labels) -> Iterator[None]:
+    """
+    Records the time taken by a block of code, or by every call of a function when used as a decorator.
+
+    Args:
+        histogram: The histogram to record the time in.
+        **labels: The value of each label.
+
+    Returns:
+        Iterator yielding once the timer has started.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+def record_response(response, *args, **kwargs) -> None:
+    """
+    Requests response hook that counts and times HTTP requests.
+
+    Args:
+        response: The HTTP response.
+
+    Returns:
+        None
+    """
+    host = get_host(response.url)
+    PAGES.inc(host=host, kind="http")
+    NAVIGATION_SECONDS.observe(response.elapsed.total_seconds(), host=host, kind="http")
+
+
+def record_file(path: str, metadata: dict) -> None:
+    """
+    Counts a file written to the output directory and its size.
+
+    Args:
+        path: Path of the completed file.
+        metadata: Dictionary describing the file (team, category, season, source_url).
+
+    Returns:
+        None
+    """
+    labels = {
+        "team": metadata.get("team", ""),
+        "host": get_host(metadata.get("source_url", "")),
+        "category": metadata.get("category", "")
+    }
+    FILES.inc(**labels)
+    FILE_BYTES.inc(os.path.getsize(path), **labels)
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    """
+    Counts a cache lookup.
+
+    Args:
+        cache: The name of the cache.
+        hit: Whether the lookup was a hit.
+
+    Returns:
+        None
+    """
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def get_host(url: str) -> str:
+    """
+    Extracts the host of a URL, used as a label so that slowdowns can be traced to a site.
+
+    Args:
+        url: The URL.
+
+    Returns:
+        The host, or an empty string for local files and missing URLs.
+    """
+    return urlparse(url or "").hostname or ""
+
+
+def render_openmetrics() -> str:
+    """
+    Renders every metric in the OpenMetrics text format.
+
+    Returns:
+        The metrics exposition.
+    """
+    lines = []
+    for metric_family in metric_families:
+        lines.append(f"# TYPE {metric_family.name} {metric_family.type}")
+        lines.append(f"# HELP {metric_family.name} {metric_family.documentation}")
+        for name, labels, value in metric_family.samples():
+            label_string = ",".join(f"{key}=\"{escape_label_value(value)}\"" for key, value in labels.items())
+            value_string = str(int(value)) if float(value).is_integer() else repr(float(value))
+            lines.append(f"{name}{{{label_string}}} {value_string}" if label_string else f"{name} {value_string}")
+
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def escape_label_value(value: str) -> str:
+    """
+    Escapes a label value for the OpenMetrics text format.
+
+    Args:
+        value: The label value.
+
+    Returns:
+        The escaped label value.
+    """
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def write_textfile(path: str) -> None:
+    """
+    Writes every metric to a file, replacing it atomically so a collector never reads a partial file.
+
+    Args:
+        path: Path of the metrics file.
+
+    Returns:
+        None
+    """
+    partial_path = f"{path}.{os.getpid()}.tmp"
+    with open(partial_path, "w") as file:
+        file.write(render_openmetrics())
+    os.replace(partial_path, path)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the metrics exposition on /metrics.
+    """
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = render_openmetrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serves the metrics on http://<host>:<port>/metrics from a background thread, for long-running modes. Only local
+    clients can connect unless another host is given.
+
+    Args:
+        port: The port to listen on.
+        host: The address to listen on.
+
+    Returns:
+        The running server.
+    """
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
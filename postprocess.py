@@ -0,0 +1,188 @@
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, Future
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+
+from utils import register_output_hook, unregister_output_hook, BOLD, GREEN, NORMAL, RED, MAX_WORKERS
+
+MAX_IMAGE_SIZE = 1600
+IMAGE_QUALITY = 75
+
+PDF_CREATOR = "NU Soccer Web Scraper"
+
+
+class PdfOptimizer:
+    """
+    Post-processes every PDF file as soon as it has been written. Images are downsampled and recompressed, the
+    document is stamped with its metadata and, if qpdf is installed, linearized. Files are queued in a process pool
+    without blocking the download that wrote them, and the output hooks registered later, such as bundles, are only
+    called with a file once it has been optimized.
+    """
+
+    def __init__(self, max_image_size: int = MAX_IMAGE_SIZE, image_quality: int = IMAGE_QUALITY):
+        self.max_image_size = max_image_size
+        self.image_quality = image_quality
+        self.qpdf_path = shutil.which("qpdf")
+        self.executor = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+
+    def add(self, path: str, metadata: dict) -> Future | None:
+        """
+        Queues a completed file to be optimized in place.
+
+        Args:
+            path: Path of the completed file.
+            metadata: Dictionary describing the file (team, category, season, source_url).
+
+        Returns:
+            The future of the optimization, which delays later output hooks until it completes. None is returned
+            for files other than PDFs.
+        """
+        if not path.endswith(".pdf"):
+            return None
+
+        future = self.executor.submit(optimize_pdf, path, metadata, self.max_image_size, self.image_quality,
+                                      self.qpdf_path)
+        future.add_done_callback(lambda finished: report_optimization(Path(path).name, finished))
+        return future
+
+    def close(self) -> None:
+        """
+        Shuts down the process pool.
+
+        Returns:
+            None
+        """
+        self.executor.shutdown()
+
+
+def report_optimization(filename: str, future: Future) -> None:
+    """
+    Prints the outcome of an optimization. A file that failed to optimize is left unchanged.
+
+    Args:
+        filename: The filename of the optimized file.
+        future: The future of the finished optimization.
+
+    Returns:
+        None
+    """
+    try:
+        original_size, optimized_size = future.result()
+    except Exception as e:
+        print(f"{BOLD}{RED}[ERROR]{NORMAL} Failed to optimize \"{filename}\" ({e})")
+        return
+
+    print(f"{BOLD}{GREEN}[SUCCESS]{NORMAL} Optimized \"{filename}\" "
+          f"({original_size // 1024} KB -> {optimized_size // 1024} KB)")
+
+
+@contextmanager
+def optimize_output() -> Iterator[PdfOptimizer]:
+    """
+    Optimizes every PDF file written while the context is active. Must be entered before any bundle, so that files
+    are optimized before they are bundled.
+
+    Returns:
+        Iterator yielding the active optimizer.
+    """
+    optimizer = PdfOptimizer()
+
+    register_output_hook(optimizer.add)
+    try:
+        yield optimizer
+    finally:
+        unregister_output_hook(optimizer.add)
+        optimizer.close()
+
+
+def optimize_pdf(path: str, metadata: dict, max_image_size: int, image_quality: int,
+                 qpdf_path: str | None) -> tuple[int, int]:
+    """
+    Downsamples and recompresses the images of a PDF file, removes duplicate objects, stamps the file's metadata and
+    linearizes it with qpdf, if available. The optimized file replaces the original, which is kept if optimizing
+    would make it larger. Runs in a worker process.
+
+    Args:
+        path: Path of the PDF file.
+        metadata: Dictionary describing the file (team, category, season, source_url).
+        max_image_size: The maximum width or height of an image, in pixels.
+        image_quality: The JPEG quality of recompressed images.
+        qpdf_path: The path of the qpdf executable, if installed.
+
+    Returns:
+        The size of the file before and after optimizing.
+    """
+    original_size = os.path.getsize(path)
+
+    writer = PdfWriter(clone_from=PdfReader(path))
+    for page in writer.pages:
+        for image_file in page.images:
+            image = image_file.image
+            if (image is None) or (max(image.size) <= max_image_size) or (image.mode not in ("RGB", "L")):
+                continue
+
+            image.thumbnail((max_image_size, max_image_size), Image.LANCZOS)
+            image_file.replace(image, quality=image_quality)
+
+        page.compress_content_streams()
+
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    writer.add_metadata(build_document_info(Path(path).stem, metadata))
+
+    optimized_path = path + ".optimized"
+    with open(optimized_path, "wb") as file:
+        writer.write(file)
+
+    if qpdf_path:
+        linearized_path = path + ".linearized"
+        try:
+            subprocess.run([qpdf_path, "--linearize", optimized_path, linearized_path], check=True,
+                           capture_output=True)
+            os.replace(linearized_path, optimized_path)
+        except subprocess.CalledProcessError:
+            if os.path.exists(linearized_path):
+                os.remove(linearized_path)
+
+    if os.path.getsize(optimized_path) > original_size:
+        os.remove(optimized_path)
+
+        writer = PdfWriter(clone_from=PdfReader(path))
+        writer.add_metadata(build_document_info(Path(path).stem, metadata))
+        with open(optimized_path, "wb") as file:
+            writer.write(file)
+
+    os.replace(optimized_path, path)
+
+    return original_size, os.path.getsize(path)
+
+
+def build_document_info(title: str, metadata: dict) -> dict[str, str]:
+    """
+    Builds the document information dictionary of a PDF file from its metadata.
+
+    Args:
+        title: The title of the document.
+        metadata: Dictionary describing the file (team, category, season, source_url).
+
+    Returns:
+        Dictionary mapping PDF document information keys to their values.
+    """
+    document_info = {
+        "/Title": title,
+        "/Creator": PDF_CREATOR,
+        "/Author": metadata.get("team"),
+        "/Subject": metadata.get("category"),
+        "/Keywords": ", ".join(str(metadata[key]) for key in ["team", "category", "season"] if metadata.get(key)),
+        "/Team": metadata.get("team"),
+        "/Category": metadata.get("category"),
+        "/Season": metadata.get("season"),
+        "/SourceURL": metadata.get("source_url"),
+    }
+
+    return {key: str(value) for key, value in document_info.items() if value}
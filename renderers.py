@@ -0,0 +1,292 @@
+import os
+import shutil
+from abc import ABC, abstractmethod
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, Future, as_completed
+from pathlib import Path
+
+import pdfkit
+
+from metrics import get_host, RENDER_SECONDS
+from utils import LazyWebDriver, download_pdf_to_cwd, link_file_to_cwd, print_failure_message, http_get, MAX_WORKERS
+
+WKHTMLTOPDF_DIR = Path(__file__).parent.absolute() / "wkhtmltopdf"
+
+WKHTMLTOPDF_OPTIONS = {
+    "quiet": "",
+    "encoding": "UTF-8",
+    "page-size": "Letter",
+    "margin-top": "10mm",
+    "margin-bottom": "10mm",
+    "margin-left": "10mm",
+    "margin-right": "10mm",
+    "javascript-delay": "200",
+    "load-error-handling": "ignore",
+    "load-media-error-handling": "ignore",
+}
+
+active_renderers = {}
+
+
+class Renderer(ABC):
+    """
+    Backend that renders pages to PDF files in the current working directory.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def fetch_page_source(self, url: str, script: str | None = None) -> str:
+        """
+        Loads a page and returns its HTML source.
+
+        Args:
+            url: URL of the site.
+            script: JavaScript to run on the page before reading its source.
+
+        Returns:
+            The page source.
+        """
+
+    @abstractmethod
+    def render_url(self, url: str, filename: str, metadata: dict | None = None, script: str | None = None) -> None:
+        """
+        Renders a page to a PDF file.
+
+        Args:
+            url: URL of the site.
+            filename: Name of the rendered file.
+            metadata: Dictionary describing the file (team, category, season, source_url), passed to output hooks.
+            script: JavaScript to run on the page before rendering it.
+
+        Returns:
+            None
+        """
+
+    @abstractmethod
+    def render_html(self, html: str, filename: str, metadata: dict | None = None) -> None:
+        """
+        Renders an HTML document to a PDF file.
+
+        Args:
+            html: The HTML document.
+            filename: Name of the rendered file.
+            metadata: Dictionary describing the file (team, category, season, source_url), passed to output hooks.
+
+        Returns:
+            None
+        """
+
+    def close(self) -> None:
+        """
+        Waits for pending renders and releases the backend's resources.
+
+        Returns:
+            None
+        """
+
+
+class ChromeRenderer(Renderer):
+    """
+    Renders pages with headless Chrome. Needed for pages that only build their content with JavaScript. A single
+    browser is launched on first use and shared by every render.
+    """
+
+    name = "chrome"
+
+    def __init__(self):
+        self.lazy_driver = LazyWebDriver()
+
+    def fetch_page_source(self, url: str, script: str | None = None) -> str:
+        driver = self.lazy_driver.get()
+        driver.get(url)
+        time.sleep(1)
+
+        if script:
+            driver.execute_script(script)
+
+        return driver.page_source
+
+    def render_url(self, url: str, filename: str, metadata: dict | None = None, script: str | None = None) -> None:
+        self.fetch_page_source(url, script)
+        download_pdf_to_cwd(self.lazy_driver.get(), filename, {"source_url": url, **(metadata or {})})
+
+    def render_html(self, html: str, filename: str, metadata: dict | None = None) -> None:
+        with tempfile.NamedTemporaryFile("w", suffix=".html", encoding="utf-8", delete=False) as file:
+            file.write(html)
+
+        try:
+            driver = self.lazy_driver.get()
+            driver.get(Path(file.name).as_uri())
+            download_pdf_to_cwd(driver, filename, metadata)
+        finally:
+            os.remove(file.name)
+
+    def close(self) -> None:
+        self.lazy_driver.quit()
+
+
+class WkhtmltopdfRenderer(Renderer):
+    """
+    Renders pages with wkhtmltopdf through pdfkit, without a browser. Suited to pages that do not need modern
+    JavaScript, such as roster print pages and generated schedule documents. Renders run in a process pool, and each
+    file is moved into the current working directory as soon as it is rendered.
+    """
+
+    name = "wkhtmltopdf"
+
+    def __init__(self):
+        self.wkhtmltopdf_path = find_wkhtmltopdf()
+        if self.wkhtmltopdf_path is None:
+            raise RuntimeError("wkhtmltopdf is not installed")
+
+        self.executor = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+        self.output_dir = tempfile.mkdtemp(dir=os.getcwd(), prefix=".renders-")
+        self.pending_renders: dict[Future, tuple[str, str, dict]] = {}
+        self.render_count = 0
+
+    def fetch_page_source(self, url: str, script: str | None = None) -> str:
+        response = http_get(url)
+        response.raise_for_status()
+        return response.text
+
+    def render_url(self, url: str, filename: str, metadata: dict | None = None, script: str | None = None) -> None:
+        self.submit("url", url, filename, {"source_url": url, **(metadata or {})}, script)
+
+    def render_html(self, html: str, filename: str, metadata: dict | None = None) -> None:
+        self.submit("string", html, filename, metadata or {}, None)
+
+    def submit(self, source_type: str, source: str, filename: str, metadata: dict, script: str | None) -> None:
+        """
+        Queues a render in the process pool, first moving any renders that have already finished.
+
+        Args:
+            source_type: Either "url" or "string".
+            source: The URL or HTML document to render.
+            filename: Name of the rendered file.
+            metadata: Dictionary describing the file (team, category, season, source_url), passed to output hooks.
+            script: JavaScript to run on the page before rendering it.
+
+        Returns:
+            None
+        """
+        for future in [future for future in self.pending_renders if future.done()]:
+            self.finish_render(future)
+
+        self.render_count += 1
+        output_path = os.path.join(self.output_dir, f"{self.render_count}-{filename}")
+        future = self.executor.submit(render_with_wkhtmltopdf, self.wkhtmltopdf_path, source_type, source,
+                                      output_path, script)
+        self.pending_renders[future] = (output_path, filename, metadata)
+
+    def finish_render(self, future: Future) -> None:
+        """
+        Moves a finished render into the current working directory and records the time it took.
+
+        Args:
+            future: The future of the finished render.
+
+        Returns:
+            None
+        """
+        output_path, filename, metadata = self.pending_renders.pop(future)
+        try:
+            RENDER_SECONDS.observe(future.result(), renderer=self.name, host=get_host(metadata.get("source_url", "")))
+            link_file_to_cwd(output_path, filename, metadata)
+        except OSError as e:
+            print_failure_message(filename, str(e))
+        finally:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+    def close(self) -> None:
+        for future in as_completed(list(self.pending_renders)):
+            self.finish_render(future)
+
+        self.executor.shutdown()
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+
+RENDERERS = {
+    ChromeRenderer.name: ChromeRenderer,
+    WkhtmltopdfRenderer.name: WkhtmltopdfRenderer,
+}
+
+
+def get_renderer(name: str) -> Renderer:
+    """
+    Returns the active renderer of a backend, creating it on first use. Falls back to Chrome if the backend is not
+    available on this machine.
+
+    Args:
+        name: The name of the backend, one of the keys of RENDERERS.
+
+    Returns:
+        The renderer.
+    """
+    if name not in active_renderers:
+        try:
+            active_renderers[name] = RENDERERS[name]()
+        except RuntimeError as e:
+            print_failure_message(f"{name} renderer", f"{e.args[0]}, falling back to chrome")
+            active_renderers[name] = get_renderer(ChromeRenderer.name)
+
+    return active_renderers[name]
+
+
+def close_renderers() -> None:
+    """
+    Waits for pending renders of every active renderer and releases their resources.
+
+    Returns:
+        None
+    """
+    for renderer in set(active_renderers.values()):
+        renderer.close()
+
+    active_renderers.clear()
+
+
+def find_wkhtmltopdf() -> str | None:
+    """
+    Finds the wkhtmltopdf executable, preferring the one bundled with the project.
+
+    Returns:
+        The path of the executable. None is returned if wkhtmltopdf is not installed.
+    """
+    for executable in ["wkhtmltopdf", "wkhtmltopdf.exe"]:
+        bundled_path = WKHTMLTOPDF_DIR / "bin" / executable
+        if bundled_path.exists():
+            return str(bundled_path)
+
+    return shutil.which("wkhtmltopdf")
+
+
+def render_with_wkhtmltopdf(wkhtmltopdf_path: str, source_type: str, source: str, output_path: str,
+                            script: str | None) -> float:
+    """
+    Renders a URL or an HTML document to a PDF file with wkhtmltopdf. Runs in a worker process.
+
+    Args:
+        wkhtmltopdf_path: The path of the wkhtmltopdf executable.
+        source_type: Either "url" or "string".
+        source: The URL or HTML document to render.
+        output_path: Path of the rendered file.
+        script: JavaScript to run on the page before rendering it.
+
+    Returns:
+        The number of seconds the render took.
+    """
+    start = time.perf_counter()
+    configuration = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf_path)
+    options = dict(WKHTMLTOPDF_OPTIONS)
+    if script:
+        options["run-script"] = script
+
+    if source_type == "url":
+        pdfkit.from_url(source, output_path, options=options, configuration=configuration)
+    else:
+        pdfkit.from_string(source, output_path, options=options, configuration=configuration)
+
+    return time.perf_counter() - start
@@ -1,44 +1,360 @@
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
 
+import pandas as pd
+import requests
+from bs4 import BeautifulSoup
+from pandas import DataFrame
 from selenium.common import TimeoutException, WebDriverException
 
-from utils import initialize_web_driver, download_pdf_to_cwd, print_failure_message
+from archive import PageArchive
+from renderers import get_renderer
+from metrics import measure, PARSE_SECONDS
+from utils import print_failure_message, print_success_message, sanitize_html, create_http_session, LazyWebDriver, \
+    MAX_WORKERS, HTTP_TIMEOUT, REMOVE_OVERLAYS_SCRIPT
 
+ROSTER_COLUMNS = ["team", "number", "name", "position", "class", "height", "hometown", "state"]
 
-def download_roster(url: str, filename: str) -> None:
+ROSTER_COLUMN_ALIASES = {
+    "number": ["#", "no.", "no", "number", "jersey"],
+    "name": ["name", "full name", "player"],
+    "position": ["pos.", "pos", "position"],
+    "class": ["cl.", "class", "yr.", "year", "academic year", "elig."],
+    "height": ["ht.", "height"],
+    "hometown": ["hometown", "hometown/high school", "hometown / high school", "hometown/previous school",
+                 "hometown / previous school", "hometown/last school", "hometown / last school"],
+}
+
+POSITION_ABBREVIATIONS = {
+    "goalkeeper": "GK",
+    "keeper": "GK",
+    "g": "GK",
+    "gk": "GK",
+    "defender": "D",
+    "back": "D",
+    "d": "D",
+    "df": "D",
+    "def": "D",
+    "midfielder": "M",
+    "midfield": "M",
+    "m": "M",
+    "mf": "M",
+    "mid": "M",
+    "forward": "F",
+    "striker": "F",
+    "f": "F",
+    "fw": "F",
+    "fwd": "F",
+}
+
+STATE_NAMES = {
+    "ala.": "Alabama", "al": "Alabama", "alaska": "Alaska", "ak": "Alaska", "ariz.": "Arizona", "az": "Arizona",
+    "ark.": "Arkansas", "ar": "Arkansas", "calif.": "California", "ca": "California", "colo.": "Colorado",
+    "co": "Colorado", "conn.": "Connecticut", "ct": "Connecticut", "del.": "Delaware", "de": "Delaware",
+    "d.c.": "District of Columbia", "dc": "District of Columbia", "fla.": "Florida", "fl": "Florida",
+    "ga.": "Georgia", "ga": "Georgia", "hawaii": "Hawaii", "hi": "Hawaii", "idaho": "Idaho", "id": "Idaho",
+    "ill.": "Illinois", "il": "Illinois", "ind.": "Indiana", "in": "Indiana", "iowa": "Iowa", "ia": "Iowa",
+    "kan.": "Kansas", "ks": "Kansas", "ky.": "Kentucky", "ky": "Kentucky", "la.": "Louisiana", "la": "Louisiana",
+    "maine": "Maine", "me": "Maine", "md.": "Maryland", "md": "Maryland", "mass.": "Massachusetts",
+    "ma": "Massachusetts", "mich.": "Michigan", "mi": "Michigan", "minn.": "Minnesota", "mn": "Minnesota",
+    "miss.": "Mississippi", "ms": "Mississippi", "mo.": "Missouri", "mo": "Missouri", "mont.": "Montana",
+    "mt": "Montana", "neb.": "Nebraska", "ne": "Nebraska", "nev.": "Nevada", "nv": "Nevada",
+    "n.h.": "New Hampshire", "nh": "New Hampshire", "n.j.": "New Jersey", "nj": "New Jersey",
+    "n.m.": "New Mexico", "nm": "New Mexico", "n.y.": "New York", "ny": "New York", "n.c.": "North Carolina",
+    "nc": "North Carolina", "n.d.": "North Dakota", "nd": "North Dakota", "ohio": "Ohio", "oh": "Ohio",
+    "okla.": "Oklahoma", "ok": "Oklahoma", "ore.": "Oregon", "or": "Oregon", "pa.": "Pennsylvania",
+    "pa": "Pennsylvania", "r.i.": "Rhode Island", "ri": "Rhode Island", "s.c.": "South Carolina",
+    "sc": "South Carolina", "s.d.": "South Dakota", "sd": "South Dakota", "tenn.": "Tennessee", "tn": "Tennessee",
+    "texas": "Texas", "tx": "Texas", "utah": "Utah", "ut": "Utah", "vt.": "Vermont", "vt": "Vermont",
+    "va.": "Virginia", "va": "Virginia", "wash.": "Washington", "wa": "Washington", "w.va.": "West Virginia",
+    "wv": "West Virginia", "wis.": "Wisconsin", "wi": "Wisconsin", "wyo.": "Wyoming", "wy": "Wyoming",
+}
+
+
+def download_roster(url: str, filename: str, metadata: dict | None = None, renderer: str = "chrome") -> None:
     """
     Downloads the roster page to a PDF file.
 
     Args:
         url: URL of the site.
         filename: Name of the downloaded file.
+        metadata: Dictionary describing the file (team, category, season, source_url), passed to output hooks.
+        renderer: Name of the backend that renders the page, one of the keys of RENDERERS.
 
     Returns:
         None
     """
-    driver = initialize_web_driver()
+    try:
+        get_renderer(renderer).render_url(url, filename, metadata, REMOVE_OVERLAYS_SCRIPT)
+    except TimeoutException as e:
+        print_failure_message(filename, e.msg)
+    except WebDriverException as e:
+        print_failure_message(filename, e.msg)
 
-    script = """
-        let removed = document.getElementById('divSatisfiChat'); 
-        if (removed) removed.parentNode.removeChild(removed);
 
-        removed = document.getElementById('transcend-consent-manager'); 
-        if (removed) removed.parentNode.removeChild(removed);
+def fetch_roster_records(teams: dict) -> DataFrame:
+    """
+    Fetches the roster pages of every team concurrently and parses them into typed player records. Pages are fetched
+    over plain HTTP, and the browser is only launched for pages whose tables cannot be found without it.
 
-        removed = document.getElementById('termly-code-snippet-support'); 
-        if (removed) removed.parentNode.removeChild(removed);
+    Args:
+        teams: Dictionary of team data keyed by team name.
+
+    Returns:
+        DataFrame of player records with the columns in ROSTER_COLUMNS.
     """
+    with create_http_session() as session, ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        page_sources = list(executor.map(lambda team_data: fetch_page_source(session, team_data["roster_url"]),
+                                         teams.values()))
 
+    lazy_driver = LazyWebDriver()
+    rosters = []
     try:
-        driver.get(url)
-        time.sleep(1)
+        for team_data, page_source in zip(teams.values(), page_sources):
+            try:
+                roster = parse_roster_records(team_data["name"], page_source) if page_source else None
 
-        driver.execute_script(script)
+                if roster is None:
+                    driver = lazy_driver.get()
+                    driver.get(team_data["roster_url"])
+                    time.sleep(1)
+                    roster = parse_roster_records(team_data["name"], driver.page_source)
 
-        download_pdf_to_cwd(driver, filename)
-    except TimeoutException as e:
-        print_failure_message(filename, e.msg)
-    except WebDriverException as e:
-        print_failure_message(filename, e.msg)
+                if roster is None:
+                    raise ValueError("Could not find a roster table")
+
+                rosters.append(roster)
+                print_success_message(f"{team_data['abbreviation']} Roster")
+            except ValueError as e:
+                print_failure_message(f"{team_data['abbreviation']} Roster", e.args[0])
+            except WebDriverException as e:
+                print_failure_message(f"{team_data['abbreviation']} Roster", e.msg)
     finally:
-        driver.quit()
+        lazy_driver.quit()
+
+    if not rosters:
+        return DataFrame(columns=ROSTER_COLUMNS)
+
+    return pd.concat(rosters, ignore_index=True)
+
+
+def reparse_roster_history(teams: dict, page_archive: PageArchive) -> DataFrame:
+    """
+    Re-runs the roster parser over every archived version of the teams' roster pages, without fetching anything, so
+    player records can be compared across the archive's history.
+
+    Args:
+        teams: Dictionary of team data keyed by team name.
+        page_archive: The archive to read roster pages from.
+
+    Returns:
+        DataFrame of player records with the columns in ROSTER_COLUMNS, followed by the time each page was fetched
+        and the run that fetched it.
+    """
+    teams_by_roster_url = {team_data["roster_url"]: team_data for team_data in teams.values()}
+
+    rosters = []
+    for header, body in page_archive.iter_pages(set(teams_by_roster_url)):
+        if (header["status"] is not None) and (header["status"] >= 400):
+            continue
+
+        roster = parse_roster_records(teams_by_roster_url[header["url"]]["name"], body.decode("utf-8", "replace"))
+        if roster is None:
+            continue
+
+        roster["fetched_at"] = header["timestamp"]
+        roster["run"] = header.get("run", "")
+        rosters.append(roster)
+
+    if not rosters:
+        return DataFrame(columns=[*ROSTER_COLUMNS, "fetched_at", "run"])
+
+    return pd.concat(rosters, ignore_index=True)
+
+
+def fetch_page_source(session: requests.Session, url: str) -> str | None:
+    """
+    Fetches a page over plain HTTP.
+
+    Args:
+        session: The HTTP session to send the request with.
+        url: URL of the site.
+
+    Returns:
+        The page source. None is returned if the request failed.
+    """
+    try:
+        response = session.get(url, timeout=HTTP_TIMEOUT)
+        return response.text if response.ok else None
+    except requests.RequestException:
+        return None
+
+
+@measure(PARSE_SECONDS, parser="roster")
+def parse_roster_records(team_name: str, page_source: str) -> DataFrame | None:
+    """
+    Parses the player table of a roster page into typed player records.
+
+    Args:
+        team_name: Name of the team.
+        page_source: HTML source of the roster page.
+
+    Returns:
+        DataFrame of player records with the columns in ROSTER_COLUMNS. None is returned if no player table was found.
+    """
+    sanitized_html = sanitize_html(BeautifulSoup(page_source, "lxml"))
+    try:
+        dataframes = pd.read_html(StringIO(sanitized_html))
+    except ValueError:
+        return None
+
+    for dataframe in dataframes:
+        columns = {}
+        for column in dataframe.columns:
+            label = " ".join(str(part) for part in column) if isinstance(column, tuple) else str(column)
+            for field, aliases in ROSTER_COLUMN_ALIASES.items():
+                if (field not in columns.values()) and (label.strip().lower() in aliases):
+                    columns[column] = field
+
+        if "name" not in columns.values():
+            continue
+
+        roster = dataframe[list(columns.keys())].rename(columns=columns)
+        for field in ROSTER_COLUMNS:
+            if field not in roster.columns:
+                roster[field] = ""
+
+        roster = roster.fillna("").astype(str).map(str.strip)
+        roster = roster[roster["name"] != ""]
+
+        roster["team"] = team_name
+        roster["number"] = pd.to_numeric(roster["number"].str.extract(r"(\d+)", expand=False), errors="coerce") \
+            .astype("Int16")
+        roster["position"] = roster["position"].map(normalize_position)
+        roster["hometown"] = roster["hometown"].str.split("/").str[0].str.strip()
+        roster["state"] = roster["hometown"].map(extract_state)
+
+        return roster[ROSTER_COLUMNS].reset_index(drop=True)
+
+    return None
+
+
+def normalize_position(position: str) -> str:
+    """
+    Normalizes a position to slash separated abbreviations (e.g., "Midfielder/Forward" becomes "M/F").
+
+    Args:
+        position: The position as listed on the roster.
+
+    Returns:
+        The normalized position.
+    """
+    abbreviations = []
+    for part in re.split(r"[/,-]", position):
+        part = part.strip().rstrip(".")
+        abbreviations.append(POSITION_ABBREVIATIONS.get(part.lower(), part.upper()))
+
+    return "/".join(abbreviation for abbreviation in abbreviations if abbreviation)
+
+
+def extract_state(hometown: str) -> str:
+    """
+    Extracts the full state name from a hometown (e.g., "Chicago, Ill." becomes "Illinois"). Hometowns outside
+    the United States keep their country as listed.
+
+    Args:
+        hometown: The hometown as listed on the roster.
+
+    Returns:
+        The state or country of the hometown.
+    """
+    if "," not in hometown:
+        return ""
+
+    region = hometown.rsplit(",", 1)[1].strip()
+    return STATE_NAMES.get(region.lower(), region)
+
+
+class RosterIndex:
+    """
+    In-memory index over player records, keyed by lowercase name, hometown, state, position and team.
+    """
+
+    def __init__(self, records: DataFrame):
+        self.records = records.reset_index(drop=True)
+        self.keys = {
+            "name": build_index(self.records["name"]),
+            "hometown": build_index(self.records["hometown"]),
+            "state": build_index(self.records["state"]),
+            "team": build_index(self.records["team"]),
+            "class": build_index(self.records["class"]),
+            "position": build_index(self.records["position"].str.split("/")),
+        }
+
+    def query(self, **filters: str) -> DataFrame:
+        """
+        Finds the players matching every filter (e.g., query(position="GK", state="Illinois")).
+
+        Args:
+            **filters: Values to match, keyed by name, hometown, state, team, class or position.
+
+        Returns:
+            DataFrame of matching player records.
+        """
+        rows = None
+        for key, value in filters.items():
+            if key == "position":
+                value = normalize_position(value)
+            matches = self.keys[key].get(value.strip().lower(), set())
+            rows = matches if rows is None else rows & matches
+
+        return self.records.iloc[sorted(rows if rows is not None else range(len(self.records)))]
+
+
+def build_index(column: pd.Series) -> dict[str, set[int]]:
+    """
+    Builds a mapping of lowercase values to the rows they appear in.
+
+    Args:
+        column: Column of values, or of lists of values, to index.
+
+    Returns:
+        Dictionary mapping each value to a set of row numbers.
+    """
+    index = {}
+    for row, values in enumerate(column):
+        for value in (values if isinstance(values, list) else [values]):
+            if value:
+                index.setdefault(str(value).lower(), set()).add(row)
+
+    return index
+
+
+def save_roster_records(records: DataFrame, filename: str) -> None:
+    """
+    Saves player records to a compressed Parquet file in the current working directory.
+
+    Args:
+        records: DataFrame of player records.
+        filename: Name of the Parquet file.
+
+    Returns:
+        None
+    """
+    records.to_parquet(filename, index=False, compression="zstd")
+    print_success_message(filename)
+
+
+def load_roster_index(filename: str) -> RosterIndex:
+    """
+    Loads player records from a Parquet file and indexes them.
+
+    Args:
+        filename: Name of the Parquet file.
+
+    Returns:
+        The index over the loaded player records.
+    """
+    return RosterIndex(pd.read_parquet(filename))
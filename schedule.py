@@ -1,15 +1,17 @@
-import time
 from io import StringIO
-from pathlib import Path
 
 import pandas as pd
+import requests
 from bs4 import BeautifulSoup
 from selenium.common import WebDriverException
 
-from utils import initialize_web_driver, sanitize_html, download_pdf_to_cwd, print_failure_message
+from renderers import get_renderer
+from metrics import measure, PARSE_SECONDS
+from utils import sanitize_html, print_failure_message, REMOVE_OVERLAYS_SCRIPT
 
 
-def download_schedule(team_name: str, url: str, filename: str) -> None:
+def download_schedule(team_name: str, url: str, filename: str, metadata: dict | None = None,
+                      renderer: str = "chrome") -> None:
     """
     Downloads the schedule page to a PDF file.
 
@@ -17,41 +19,27 @@ def download_schedule(team_name: str, url: str, filename: str) -> None:
         team_name: Name of the team.
         url: URL of the site.
         filename: Name of the downloaded file.
+        metadata: Dictionary describing the file (team, category, season, source_url), passed to output hooks.
+        renderer: Name of the backend that renders the page, one of the keys of RENDERERS.
 
     Returns:
         None
     """
-    driver = initialize_web_driver()
-
-    script = """
-        let removed = document.getElementById('divSatisfiChat'); 
-        if (removed) removed.parentNode.removeChild(removed);
-
-        removed = document.getElementById('transcend-consent-manager'); 
-        if (removed) removed.parentNode.removeChild(removed);
-
-        removed = document.getElementById('termly-code-snippet-support'); 
-        if (removed) removed.parentNode.removeChild(removed);
-    """
+    scrape_schedule = [
+        "Northwestern",
+        "Indiana",
+        "Ohio State",
+        "UCLA",
+        "Michigan State",
+        "Michigan",
+        "DePaul"
+    ]
 
     try:
-        driver.get(url)
-        time.sleep(1)
-
-        driver.execute_script(script)
-
-        scrape_schedule = [
-            "Northwestern",
-            "Indiana",
-            "Ohio State",
-            "UCLA",
-            "Michigan State",
-            "Michigan",
-            "DePaul"
-        ]
+        page_renderer = get_renderer(renderer)
 
         if team_name in scrape_schedule:
-            soup = BeautifulSoup(driver.page_source, "lxml")
+            soup = BeautifulSoup(page_renderer.fetch_page_source(url, REMOVE_OVERLAYS_SCRIPT), "lxml")
 
             extracted_tables = extract_tables(soup)
 
@@ -60,22 +48,18 @@ def download_schedule(team_name: str, url: str, filename: str) -> None:
 
             full_html = build_html_document(soup.find("title").text, extracted_tables)
 
-            script_dir = Path(__file__).parent.absolute()
-
-            with open(script_dir / "temp.html", "w") as f:
-                f.write(full_html)
-
-            driver.get(f"file:///{str(script_dir / "temp.html")}")
-
-        download_pdf_to_cwd(driver, filename)
+            page_renderer.render_html(full_html, filename, {"source_url": url, **(metadata or {})})
+        else:
+            page_renderer.render_url(url, filename, metadata, REMOVE_OVERLAYS_SCRIPT)
     except ValueError as e:
         print_failure_message(filename, e.args[0])
+    except requests.RequestException as e:
+        print_failure_message(filename, str(e))
     except WebDriverException as e:
         print_failure_message(filename, e.msg)
-    finally:
-        driver.quit()
 
 
+@measure(PARSE_SECONDS, parser="schedule")
 def extract_tables(soup: BeautifulSoup) -> list[str] | None:
     """
     Extracts and processes tables from the HTML document.
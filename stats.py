@@ -1,9 +1,42 @@
+import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
+import requests
 from bs4 import BeautifulSoup
 from selenium.common import TimeoutException, WebDriverException
 
-from utils import initialize_web_driver, response_pdf_to_cwd, print_failure_message
+from box_scores import get_latest_box_score_url
+from metrics import measure, record_cache_lookup, PARSE_SECONDS
+from utils import print_failure_message, copy_file_to_cwd, stream_response_to_path, create_http_session, \
+    PooledWebDriver, WebDriverPool, CACHE_DIR, MAX_WORKERS, HTTP_TIMEOUT
+
+STATS_CACHE_DIR = CACHE_DIR / "stats"
+STATS_INDEX_PATH = STATS_CACHE_DIR / "index.json"
+
+pdf_url_in_embed = [
+    "Northwestern",
+    "Indiana",
+    "Ohio State",
+    "UCLA",
+    "Michigan State",
+    "Michigan",
+    "DePaul"
+]
+
+pdf_url_in_object = [
+    "Maryland",
+    "Washington",
+    "Rutgers",
+    "Wisconsin",
+    "Penn State",
+    "UIC",
+    "Loyola Chicago",
+    "Northern Illinois",
+    "Chicago State"
+]
 
 
 def download_stats(team_data: dict, years: list[int]) -> None:
@@ -17,60 +50,237 @@ def download_stats(team_data: dict, years: list[int]) -> None:
     Returns:
         None
     """
-    driver = initialize_web_driver()
-
-    pdf_url_in_embed = [
-        "Northwestern",
-        "Indiana",
-        "Ohio State",
-        "UCLA",
-        "Michigan State",
-        "Michigan",
-        "DePaul"
-    ]
-
-    pdf_url_in_object = [
-        "Maryland",
-        "Washington",
-        "Rutgers",
-        "Wisconsin",
-        "Penn State",
-        "UIC",
-        "Loyola Chicago",
-        "Northern Illinois",
-        "Chicago State"
-    ]
-
-    for year in years:
-        filename = f"{team_data['abbreviation']} {year} Stats.pdf"
-
-        try:
-            if (team_data["name"] == "Penn State") or (team_data["name"] == "Northern Illinois"):
-                driver.get(team_data["stats_url"][str(year)])
-            else:
-                driver.get(team_data["stats_url"].format(year))
-
-            time.sleep(1)
-
-            doc = BeautifulSoup(driver.page_source, "lxml")
-
-            if team_data["name"] in pdf_url_in_embed:
-                embed_tag = doc.find("embed")
-                if embed_tag:
-                    response_pdf_to_cwd(embed_tag["src"], filename)
-                    continue
-            elif team_data["name"] in pdf_url_in_object:
-                object_tag = doc.find("object")
-                if object_tag:
-                    response_pdf_to_cwd(object_tag["data"], filename)
-                    continue
+    download_stats_for_teams([team_data], years)
+
+
+def download_stats_for_teams(teams_data: list[dict], years: list[int]) -> None:
+    """
+    Downloads the season stats of every team for every year concurrently. Completed past seasons are kept in a local
+    store and never fetched again, and the current season is only fetched again once a newer result has been posted.
+    Each team's latest result is looked up by the job of its current season, sharing the jobs' HTTP session and web
+    drivers.
 
+    Args:
+        teams_data: List of dictionaries containing team data.
+        years: Years for which to print stats for.
+
+    Returns:
+        None
+    """
+    stats_index = load_stats_index()
+    current_year = datetime.now().year
+
+    jobs = [(team_data, str(year)) for team_data in teams_data for year in years]
+
+    index_lock = threading.Lock()
+    driver_pool = WebDriverPool()
+    try:
+        with create_http_session() as session, ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            def download_job(job: tuple[dict, str]) -> None:
+                team_data, year = job
+                latest_result = None
+                if int(year) == current_year:
+                    latest_result = fetch_latest_result(session, driver_pool, team_data)
+
+                entry = stats_index.get(stats_key(team_data, year))
+                entry = fetch_season_stats(session, driver_pool, team_data, year, entry, latest_result)
+                if entry is None:
+                    return
+
+                if int(year) < current_year:
+                    entry["immutable"] = True
+
+                with index_lock:
+                    stats_index[stats_key(team_data, year)] = entry
+
+            list(executor.map(download_job, jobs))
+    finally:
+        driver_pool.quit()
+        save_stats_index(stats_index)
+
+
+def fetch_latest_result(session: requests.Session, driver_pool: WebDriverPool, team_data: dict) -> str | None:
+    """
+    Get the URL of a team's most recent box score, used to tell if its current season stats have changed.
+
+    Args:
+        session: The HTTP session to send requests with.
+        driver_pool: The pool of web drivers used if the schedule cannot be fetched over plain HTTP.
+        team_data: Dictionary containing team data.
+
+    Returns:
+        The URL of the most recent box score. None is returned if it could not be found.
+    """
+    pooled_driver = PooledWebDriver(driver_pool)
+    try:
+        return get_latest_box_score_url(session, pooled_driver, team_data)
+    except (requests.RequestException, RuntimeError, WebDriverException):
+        return None
+    finally:
+        pooled_driver.quit()
+
+
+def fetch_season_stats(session: requests.Session, driver_pool: WebDriverPool, team_data: dict, year: str,
+                       entry: dict | None, latest_result: str | None) -> dict | None:
+    """
+    Copies a team's season stats to the current working directory, only fetching them if the stored copy is missing
+    or outdated.
+
+    Args:
+        session: The HTTP session to send requests with.
+        driver_pool: The pool of web drivers used for pages that cannot be resolved over plain HTTP.
+        team_data: Dictionary containing team data.
+        year: The year of the season.
+        entry: The stored entry of the season, if any.
+        latest_result: The URL of the team's most recent box score, used to tell if the current season has changed.
+
+    Returns:
+        The entry describing the stored season stats. None is returned if the stats could not be downloaded.
+    """
+    filename = f"{team_data['abbreviation']} {year} Stats.pdf"
+    metadata = {"team": team_data["name"], "category": "Stats", "season": year}
+    cache_path = STATS_CACHE_DIR / filename
+
+    if entry and cache_path.exists():
+        is_unchanged = (latest_result is not None) and (entry.get("latest_result") == latest_result)
+        if entry.get("immutable") or is_unchanged:
+            record_cache_lookup("stats", True)
+            copy_file_to_cwd(cache_path, filename, {"source_url": entry["source_url"], **metadata})
+            return entry
+
+    record_cache_lookup("stats", False)
+
+    try:
+        pdf_url = resolve_stats_pdf_url(session, driver_pool, team_data, year)
+        if pdf_url is None:
             print_failure_message(filename, "Could not find the PDF url")
-        except TimeoutException as e:
-            print_failure_message(filename, e.msg)
-            continue
-        except WebDriverException as e:
-            print_failure_message(filename, e.msg)
-            continue
-
-    driver.quit()
+            return None
+
+        response = session.get(pdf_url, stream=True, timeout=HTTP_TIMEOUT)
+        if response.status_code == 404:
+            response.close()
+            print_failure_message(filename, "Found a PDF URL, but it doesn't link to an existing file")
+            return None
+
+        stream_response_to_path(response, cache_path)
+    except requests.RequestException as e:
+        print_failure_message(filename, str(e))
+        return None
+    except TimeoutException as e:
+        print_failure_message(filename, e.msg)
+        return None
+    except WebDriverException as e:
+        print_failure_message(filename, e.msg)
+        return None
+
+    copy_file_to_cwd(cache_path, filename, {"source_url": pdf_url, **metadata})
+
+    return {
+        "source_url": pdf_url,
+        "latest_result": latest_result,
+        "immutable": False,
+        "fetched_at": datetime.now().isoformat(timespec="seconds")
+    }
+
+
+def resolve_stats_pdf_url(session: requests.Session, driver_pool: WebDriverPool, team_data: dict,
+                          year: str) -> str | None:
+    """
+    Finds the URL of a team's season stats PDF, over plain HTTP if possible and with the browser otherwise.
+
+    Args:
+        session: The HTTP session to send requests with.
+        driver_pool: The pool of web drivers used for pages that cannot be resolved over plain HTTP.
+        team_data: Dictionary containing team data.
+        year: The year of the season.
+
+    Returns:
+        The URL of the stats PDF. None is returned if it could not be found.
+    """
+    if (team_data["name"] == "Penn State") or (team_data["name"] == "Northern Illinois"):
+        stats_url = team_data["stats_url"].get(year)
+        if stats_url is None:
+            return None
+    else:
+        stats_url = team_data["stats_url"].format(year)
+
+    try:
+        response = session.get(stats_url, timeout=HTTP_TIMEOUT)
+        if response.ok:
+            pdf_url = find_stats_pdf_url(team_data, BeautifulSoup(response.text, "lxml"))
+            if pdf_url:
+                return pdf_url
+    except requests.RequestException:
+        pass
+
+    with driver_pool.acquire() as driver:
+        driver.get(stats_url)
+        time.sleep(1)
+        return find_stats_pdf_url(team_data, BeautifulSoup(driver.page_source, "lxml"))
+
+
+@measure(PARSE_SECONDS, parser="stats")
+def find_stats_pdf_url(team_data: dict, doc: BeautifulSoup) -> str | None:
+    """
+    Finds the URL of the stats PDF embedded in a stats page.
+
+    Args:
+        team_data: Dictionary containing team data.
+        doc: The BeautifulSoup object containing the parsed HTML.
+
+    Returns:
+        The URL of the stats PDF. None is returned if it could not be found.
+    """
+    if team_data["name"] in pdf_url_in_embed:
+        embed_tag = doc.find("embed")
+        if embed_tag and embed_tag.get("src"):
+            return embed_tag["src"]
+    elif team_data["name"] in pdf_url_in_object:
+        object_tag = doc.find("object")
+        if object_tag and object_tag.get("data"):
+            return object_tag["data"]
+
+    return None
+
+
+def stats_key(team_data: dict, year: str) -> str:
+    """
+    Builds the key of a team's season in the stats index.
+
+    Args:
+        team_data: Dictionary containing team data.
+        year: The year of the season.
+
+    Returns:
+        The key of the season.
+    """
+    return f"{team_data['name']}|{year}"
+
+
+def load_stats_index() -> dict:
+    """
+    Loads the index of stored season stats.
+
+    Returns:
+        Dictionary of stored seasons keyed by stats_key.
+    """
+    if not STATS_INDEX_PATH.exists():
+        return {}
+
+    with open(STATS_INDEX_PATH, "r") as file:
+        return json.load(file)
+
+
+def save_stats_index(stats_index: dict) -> None:
+    """
+    Saves the index of stored season stats.
+
+    Args:
+        stats_index: Dictionary of stored seasons keyed by stats_key.
+
+    Returns:
+        None
+    """
+    STATS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(STATS_INDEX_PATH, "w") as file:
+        json.dump(stats_index, file, indent=2)
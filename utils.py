@@ -2,22 +2,62 @@ import argparse
 import base64
 import datetime as dt
 import os
+import queue
+import shutil
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
 
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import Tag
 from selenium import webdriver
-from selenium.common import InvalidArgumentException
+from selenium.common import InvalidArgumentException, WebDriverException
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.print_page_options import PrintOptions
-from webdriver_manager.chrome import ChromeDriverManager
+from selenium.webdriver.support.events import EventFiringWebDriver
+
+import archive
+import browser_endpoint
+import metrics
 
 BOLD = '\033[1m'
 NORMAL = '\033[0m'
 RED = '\033[31m'
 GREEN = '\033[32m'
 
+CACHE_DIR = Path(__file__).parent.absolute() / ".cache"
+
+MAX_WORKERS = 8
+DRIVER_POOL_SIZE = 3
+DRIVER_LAUNCH_ATTEMPTS = 2
+HTTP_TIMEOUT = 30
+PDF_CHUNK_SIZE = 256 * 1024
+PRINT_MARGIN_INCHES = 1 / 2.54
+
+REMOVE_OVERLAYS_SCRIPT = """
+    var removed = document.getElementById('divSatisfiChat');
+    if (removed) removed.parentNode.removeChild(removed);
+
+    removed = document.getElementById('transcend-consent-manager');
+    if (removed) removed.parentNode.removeChild(removed);
+
+    removed = document.getElementById('termly-code-snippet-support');
+    if (removed) removed.parentNode.removeChild(removed);
+"""
+
+output_hooks: list[Callable[[str, dict], Future | None]] = []
+pending_output_hooks = 0
+output_hooks_condition = threading.Condition()
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "Chrome/124.0.0.0 Safari/537.36"
+}
+
 
 def validate_box_scores_argument(box_scores: int) -> int:
     """
@@ -34,6 +74,39 @@ def validate_box_scores_argument(box_scores: int) -> int:
     return box_scores
 
 
+def validate_stats_argument(years: list[str]) -> list[str]:
+    """
+    Performs validation of the stats argument by checking if every year is a four digit year.
+
+    Args:
+        years: The years to validate.
+
+    Returns:
+        list[str]
+    """
+    for year in years:
+        if not (len(year) == 4 and year.isdigit()):
+            raise argparse.ArgumentTypeError(f"expected years formatted as YYYY, got \"{year}\"")
+
+    return list(dict.fromkeys(years))
+
+
+def validate_replay_at_argument(timestamp: str) -> datetime:
+    """
+    Performs validation of the replay cutoff argument by checking if it is an ISO 8601 date and time.
+
+    Args:
+        timestamp: The cutoff time to validate.
+
+    Returns:
+        datetime
+    """
+    try:
+        return datetime.fromisoformat(timestamp)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a time formatted as YYYY-MM-DDTHH:MM:SS, got \"{timestamp}\"")
+
+
 def format_date(date_string: str) -> dt.date | None:
     """
     Attempts to format the date string with the MM/DD/YYYY format.
@@ -78,19 +151,65 @@ def validate_articles_argument(dates: list[str]) -> list[dt.date]:
     return sorted(formatted_dates)
 
 
+def validate_player_filters_argument(filters: list[str]) -> dict[str, str]:
+    """
+    Performs validation of the player filters argument by checking if each filter is of the form KEY=VALUE with a
+    supported key.
+
+    Args:
+        filters: The filters to validate.
+
+    Returns:
+        dict[str, str]
+    """
+    keys = ["name", "position", "class", "hometown", "state", "team"]
+
+    validated_filters = {}
+    for player_filter in filters:
+        key, separator, value = player_filter.partition("=")
+        if (not separator) or (key.strip().lower() not in keys) or (not value.strip()):
+            raise argparse.ArgumentTypeError(f"expected filters formatted as KEY=VALUE with KEY one of {', '.join(keys)}")
+
+        validated_filters[key.strip().lower()] = value.strip()
+
+    return validated_filters
+
+
+def validate_shard_argument(shard: str) -> tuple[int, int]:
+    """
+    Performs validation of the shard argument by checking if it is of the form i/N with 0 <= i < N.
+
+    Args:
+        shard: The shard to validate.
+
+    Returns:
+        tuple[int, int]
+    """
+    shard_index, separator, shard_count = shard.partition("/")
+    if (not separator) or (not shard_index.isdigit()) or (not shard_count.isdigit()) or (
+            int(shard_index) >= int(shard_count)):
+        raise argparse.ArgumentTypeError("expected a shard formatted as i/N with 0 <= i < N")
+
+    return int(shard_index), int(shard_count)
+
+
 def initialize_web_driver() -> webdriver.Chrome:
     """
-    Initializes a new web driver instance with robust configuration.
+    Initializes a new web driver instance with robust configuration. Page loads are counted and timed for the run's
+    metrics. When the persistent browser is enabled, the driver attaches to it instead of launching a new browser.
+    While replaying an archive, a stand-in that serves archived pages is returned instead, and while recording, the
+    driver records every page source it reads. If the driver fails to start, the cached chromedriver path is dropped
+    and the launch is retried once, as the cached chromedriver may no longer match the installed Chrome.
 
     Returns:
         A new web driver instance.
     """
+    if archive.replaying:
+        return archive.ReplayDriver()
 
-    service = Service(
-        ChromeDriverManager().install(),
-        service_args=['--verbose'],
-        connect_timeout=30
-    )
+    if browser_endpoint.enabled:
+        driver = EventFiringWebDriver(browser_endpoint.attach_web_driver(), metrics.NavigationListener())
+        return archive.RecordingDriver(driver) if archive.active_archive is not None else driver
 
     chrome_options = Options()
 
@@ -116,22 +235,193 @@ def initialize_web_driver() -> webdriver.Chrome:
     chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
     chrome_options.add_experimental_option('useAutomationExtension', False)
 
-    try:
-        driver = webdriver.Chrome(
-            service=service,
-            options=chrome_options,
+    for attempt in range(DRIVER_LAUNCH_ATTEMPTS):
+        service = Service(
+            browser_endpoint.get_chromedriver_path(),
+            service_args=['--verbose'],
+            connect_timeout=30
         )
 
-        # Additional stability configurations
-        driver.set_page_load_timeout(30)
-        driver.set_script_timeout(20)
-        driver.implicitly_wait(10)
+        try:
+            driver = webdriver.Chrome(
+                service=service,
+                options=chrome_options,
+            )
 
-        return driver
+            # Additional stability configurations
+            driver.set_page_load_timeout(30)
+            driver.set_script_timeout(20)
+            driver.implicitly_wait(10)
 
-    except Exception as e:
-        service.stop()  # Clean up service if initialization fails
-        raise RuntimeError(f"Failed to initialize WebDriver: {str(e)}")
+            metrics.DRIVER_LAUNCHES.inc()
+            driver = EventFiringWebDriver(driver, metrics.NavigationListener())
+
+            return archive.RecordingDriver(driver) if archive.active_archive is not None else driver
+
+        except Exception as e:
+            service.stop()  # Clean up service if initialization fails
+            browser_endpoint.forget_chromedriver_path()  # The cached chromedriver may not match the installed Chrome
+            if attempt == DRIVER_LAUNCH_ATTEMPTS - 1:
+                raise RuntimeError(f"Failed to initialize WebDriver: {str(e)}")
+
+
+class LazyWebDriver:
+    """
+    Wraps a web driver that is only launched the first time a page actually needs the browser.
+    """
+
+    def __init__(self):
+        self._driver = None
+
+    def get(self) -> webdriver.Chrome:
+        """
+        Returns the web driver, launching it on first use.
+
+        Returns:
+            The web driver instance.
+        """
+        if self._driver is None:
+            self._driver = initialize_web_driver()
+        return self._driver
+
+    def quit(self) -> None:
+        """
+        Quits the web driver if it was ever launched.
+
+        Returns:
+            None
+        """
+        if self._driver is not None:
+            self._driver.quit()
+            self._driver = None
+
+
+class PooledWebDriver:
+    """
+    Borrows a web driver from a pool the first time a page actually needs the browser. Has the same interface as
+    LazyWebDriver, so it can be passed to functions that only launch the browser as a fallback.
+    """
+
+    def __init__(self, driver_pool: "WebDriverPool"):
+        self.driver_pool = driver_pool
+        self._lease = None
+        self._driver = None
+
+    def get(self) -> webdriver.Chrome:
+        """
+        Returns the borrowed web driver, borrowing it on first use.
+
+        Returns:
+            The web driver instance.
+        """
+        if self._driver is None:
+            lease = self.driver_pool.acquire()
+            self._driver = lease.__enter__()
+            self._lease = lease
+        return self._driver
+
+    def quit(self) -> None:
+        """
+        Returns the web driver to the pool if it was ever borrowed.
+
+        Returns:
+            None
+        """
+        if self._lease is not None:
+            self._lease.__exit__(None, None, None)
+            self._lease = None
+            self._driver = None
+
+
+class WebDriverPool:
+    """
+    Shares a bounded number of lazily launched web drivers between worker threads.
+    """
+
+    def __init__(self, size: int = DRIVER_POOL_SIZE):
+        self.size = size
+        self.drivers = []
+        self.idle_drivers = queue.Queue()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self) -> Iterator[webdriver.Chrome]:
+        """
+        Lends a web driver to the calling thread, launching a new one if none are idle and the pool is not full.
+
+        Returns:
+            Iterator yielding the web driver instance.
+        """
+        with self.lock:
+            launch = self.idle_drivers.empty() and (len(self.drivers) < self.size)
+            if launch:
+                self.drivers.append(None)
+
+        if launch:
+            try:
+                driver = initialize_web_driver()
+            except RuntimeError:
+                with self.lock:
+                    self.drivers.remove(None)
+                raise
+
+            with self.lock:
+                self.drivers[self.drivers.index(None)] = driver
+        else:
+            driver = self.idle_drivers.get()
+
+        try:
+            yield driver
+        finally:
+            self.idle_drivers.put(driver)
+
+    def quit(self) -> None:
+        """
+        Quits every web driver launched by the pool.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            drivers = [driver for driver in self.drivers if driver is not None]
+            self.drivers = []
+
+        for driver in drivers:
+            driver.quit()
+
+
+def create_http_session(pool_size: int = MAX_WORKERS) -> requests.Session:
+    """
+    Creates an HTTP session whose connection pool is large enough to be shared by worker threads. Page fetches go
+    through the active archive, if any, and every response is counted and timed for the run's metrics.
+
+    Args:
+        pool_size: The number of connections kept open per host.
+
+    Returns:
+        A new HTTP session.
+    """
+    session = archive.ArchiveSession()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(HTTP_HEADERS)
+    session.hooks["response"].append(metrics.record_response)
+    return session
+
+
+def http_get(url: str) -> requests.Response:
+    """
+    Sends a single HTTP GET request for a page, through the active archive if any.
+
+    Args:
+        url: URL of the page.
+
+    Returns:
+        The HTTP response.
+    """
+    with create_http_session(pool_size=1) as session:
+        return session.get(url, timeout=HTTP_TIMEOUT)
 
 
 def sanitize_html(doc: Tag | None) -> str:
@@ -154,50 +444,288 @@ def sanitize_html(doc: Tag | None) -> str:
     return str(doc)
 
 
-def download_pdf_to_cwd(driver: webdriver.Chrome, filename: str) -> None:
+def download_pdf_to_cwd(driver: webdriver.Chrome, filename: str, metadata: dict | None = None) -> None:
     """
-    Performs Selenium's print function and saves the PDF bytes to the zip file.
+    Performs Chrome's print function and streams the PDF bytes to a file in the current working directory. The time
+    taken is recorded in the run's metrics.
 
     Args:
         driver: Selenium webdriver instance.
         filename: The filename of the PDF file.
+        metadata: Dictionary describing the file (team, category, season, source_url), passed to output hooks.
 
     Returns:
         None
     """
-    try:
-        print_options = PrintOptions()
-        pdf = driver.print_page(print_options)
-        pdf_bytes = base64.b64decode(pdf)
+    metadata = {"source_url": driver.current_url, **(metadata or {})}
 
-        output_file = os.getcwd() + "/" + filename
-        with open(output_file, 'wb') as file:
-            file.write(pdf_bytes)
+    try:
+        with metrics.measure(metrics.RENDER_SECONDS, renderer="chrome", host=metrics.get_host(metadata["source_url"])):
+            write_chunks_to_cwd(iter_print_page_chunks(driver), filename, metadata)
 
         print_success_message(filename)
     except InvalidArgumentException as e:
         print_failure_message(filename, e.msg)
 
 
-def response_pdf_to_cwd(pdf_url: str, filename: str) -> None:
+def iter_print_page_chunks(driver: webdriver.Chrome, chunk_size: int = PDF_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Prints the current page with the DevTools protocol and reads the PDF back in chunks, so the whole document is
+    never held in memory. Falls back to Selenium's print function if the DevTools protocol is unavailable.
+
+    Args:
+        driver: Selenium webdriver instance.
+        chunk_size: The maximum number of bytes to read per chunk.
+
+    Returns:
+        Iterator of PDF byte chunks.
+    """
+    try:
+        result = driver.execute_cdp_cmd("Page.printToPDF", {
+            "transferMode": "ReturnAsStream",
+            "marginTop": PRINT_MARGIN_INCHES,
+            "marginBottom": PRINT_MARGIN_INCHES,
+            "marginLeft": PRINT_MARGIN_INCHES,
+            "marginRight": PRINT_MARGIN_INCHES,
+        })
+    except (AttributeError, WebDriverException):
+        yield base64.b64decode(driver.print_page(PrintOptions()))
+        return
+
+    stream_handle = result["stream"]
+    try:
+        while True:
+            chunk = driver.execute_cdp_cmd("IO.read", {"handle": stream_handle, "size": chunk_size})
+            if chunk.get("base64Encoded"):
+                yield base64.b64decode(chunk["data"])
+            else:
+                yield chunk["data"].encode("utf-8")
+
+            if chunk.get("eof"):
+                break
+    finally:
+        driver.execute_cdp_cmd("IO.close", {"handle": stream_handle})
+
+
+def write_chunks_to_cwd(chunks: Iterable[bytes], filename: str, metadata: dict | None = None) -> int:
     """
-    Sends an HTTP GET request for PDF bytes and writes them to a zip file.
+    Writes byte chunks to a file in the current working directory as they arrive. The file is written under a
+    temporary name and only renamed once complete, so a failed download never leaves a truncated PDF behind. Every
+    registered output hook is then called with the completed file.
+
+    Args:
+        chunks: Iterable of byte chunks.
+        filename: The filename of the file.
+        metadata: Dictionary describing the file (team, category, season, source_url), passed to output hooks.
+
+    Returns:
+        The number of bytes written.
+    """
+    output_file = os.getcwd() + "/" + filename
+    partial_file = output_file + ".part"
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    bytes_written = 0
+    try:
+        with open(partial_file, "wb") as file:
+            for chunk in chunks:
+                file.write(chunk)
+                bytes_written += len(chunk)
+
+        os.replace(partial_file, output_file)
+    finally:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+
+    run_output_hooks(output_file, metadata)
+
+    return bytes_written
+
+
+def stream_response_to_path(response: requests.Response, path: str | Path) -> None:
+    """
+    Streams the body of an HTTP response to a file outside the current working directory, without calling output
+    hooks. The file is written under a temporary name and only renamed once complete.
+
+    Args:
+        response: The streamed HTTP response.
+        path: Path of the file.
+
+    Returns:
+        None
+    """
+    path = Path(path)
+    partial_path = path.with_name(path.name + ".part")
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    try:
+        with response, open(partial_path, "wb") as file:
+            for chunk in response.iter_content(chunk_size=PDF_CHUNK_SIZE):
+                file.write(chunk)
+        partial_path.replace(path)
+    finally:
+        partial_path.unlink(missing_ok=True)
+
+
+def link_file_to_cwd(path: str | Path, filename: str, metadata: dict | None = None) -> None:
+    """
+    Hard links a locally stored file into the current working directory, copying it if the file system does not
+    support hard links.
+
+    Args:
+        path: Path of the stored file.
+        filename: The filename of the link.
+        metadata: Dictionary describing the file (team, category, season, source_url), passed to output hooks.
+
+    Returns:
+        None
+    """
+    output_file = os.getcwd() + "/" + filename
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    if os.path.exists(output_file):
+        os.remove(output_file)
+
+    try:
+        os.link(path, output_file)
+    except OSError:
+        shutil.copyfile(path, output_file)
+
+    run_output_hooks(output_file, metadata)
+    print_success_message(filename)
+
+
+def run_output_hooks(output_file: str, metadata: dict | None = None) -> None:
+    """
+    Counts a completed file in the run's metrics, then calls every registered output hook with it.
+
+    Args:
+        output_file: Path of the completed file.
+        metadata: Dictionary describing the file (team, category, season, source_url).
+
+    Returns:
+        None
+    """
+    metrics.record_file(output_file, metadata or {})
+
+    call_output_hooks(list(output_hooks), output_file, metadata or {})
+
+
+def call_output_hooks(hooks: list[Callable[[str, dict], Future | None]], output_file: str, metadata: dict) -> None:
+    """
+    Calls output hooks in order with a completed file. A hook that processes the file in the background returns a
+    future, and the remaining hooks are only called once it completes, without blocking the caller.
+
+    Args:
+        hooks: The output hooks to call.
+        output_file: Path of the completed file.
+        metadata: Dictionary describing the file (team, category, season, source_url).
+
+    Returns:
+        None
+    """
+    global pending_output_hooks
+
+    for index, output_hook in enumerate(hooks):
+        pending = output_hook(output_file, metadata)
+        if pending is None:
+            continue
+
+        with output_hooks_condition:
+            pending_output_hooks += 1
+
+        def resume(_: Future, remaining_hooks=hooks[index + 1:]) -> None:
+            global pending_output_hooks
+            try:
+                call_output_hooks(remaining_hooks, output_file, metadata)
+            except Exception as e:
+                print_failure_message(os.path.basename(output_file), str(e))
+            finally:
+                with output_hooks_condition:
+                    pending_output_hooks -= 1
+                    output_hooks_condition.notify_all()
+
+        pending.add_done_callback(resume)
+        return
+
+
+def wait_for_output_hooks() -> None:
+    """
+    Waits until every output hook deferred by a background hook has been called.
+
+    Returns:
+        None
+    """
+    with output_hooks_condition:
+        output_hooks_condition.wait_for(lambda: pending_output_hooks == 0)
+
+
+def copy_file_to_cwd(path: str | Path, filename: str, metadata: dict | None = None) -> None:
+    """
+    Streams a locally stored file into the current working directory.
+
+    Args:
+        path: Path of the stored file.
+        filename: The filename of the copy.
+        metadata: Dictionary describing the file (team, category, season, source_url), passed to output hooks.
+
+    Returns:
+        None
+    """
+    with open(path, "rb") as file:
+        write_chunks_to_cwd(iter(lambda: file.read(PDF_CHUNK_SIZE), b""), filename, metadata)
+
+    print_success_message(filename)
+
+
+def register_output_hook(output_hook: Callable[[str, dict], Future | None]) -> None:
+    """
+    Registers a function to be called with the path and metadata of every file once it has been fully written. Hooks
+    are called in the order they were registered. A hook may return a future to delay the hooks registered after it
+    until the future completes.
+
+    Args:
+        output_hook: The function to call.
+
+    Returns:
+        None
+    """
+    output_hooks.append(output_hook)
+
+
+def unregister_output_hook(output_hook: Callable[[str, dict], Future | None]) -> None:
+    """
+    Removes a previously registered output hook.
+
+    Args:
+        output_hook: The function to remove.
+
+    Returns:
+        None
+    """
+    if output_hook in output_hooks:
+        output_hooks.remove(output_hook)
+
+
+def response_pdf_to_cwd(pdf_url: str, filename: str, metadata: dict | None = None) -> None:
+    """
+    Sends an HTTP GET request for PDF bytes and streams them to a file in the current working directory.
 
     Args:
         pdf_url: The URL of the PDF file.
         filename: The filename of the PDF file.
+        metadata: Dictionary describing the file (team, category, season, source_url), passed to output hooks.
 
     Returns:
         None
     """
-    response = requests.get(pdf_url)
-    if response.status_code == 404:
-        print_failure_message(filename, "Found a PDF URL, but it doesn't link to an existing file")
-        return
+    with requests.get(pdf_url, stream=True, timeout=HTTP_TIMEOUT) as response:
+        if response.status_code == 404:
+            print_failure_message(filename, "Found a PDF URL, but it doesn't link to an existing file")
+            return
 
-    output_file = os.getcwd() + "/" + filename
-    with open(output_file, "wb") as file:
-        file.write(response.content)
+        write_chunks_to_cwd(response.iter_content(chunk_size=PDF_CHUNK_SIZE), filename,
+                            {"source_url": pdf_url, **(metadata or {})})
 
     print_success_message(filename)
 
@@ -241,6 +769,7 @@ def print_failure_message(filename: str, reason: str) -> None:
     Returns:
         None
     """
+    metrics.FAILURES.inc()
     print(f"{BOLD}{RED}[ERROR]{NORMAL} Failed to download \"{filename}\" ({reason})")
 
 
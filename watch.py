@@ -0,0 +1,320 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+import requests
+from bs4 import BeautifulSoup
+
+from articles import fetch_articles, download_articles, extract_articles
+from box_scores import download_box_scores_by_url, get_boost_box_score_pdf_urls, extract_matches, \
+    store_sidearm_calendar
+from metrics import record_cache_lookup
+from stats import download_stats_for_teams
+from utils import create_http_session, LazyWebDriver, CACHE_DIR, HTTP_TIMEOUT, BOLD, GREEN, NORMAL, RED
+
+WATCH_STATE_PATH = CACHE_DIR / "watch.json"
+
+ACTIVE_POLL_SECONDS = 60
+IDLE_POLL_SECONDS = 30 * 60
+RESULT_WINDOW_START = timedelta(minutes=100)
+RESULT_WINDOW_END = timedelta(hours=4)
+
+
+def watch_teams(teams_data: list[dict], article_format: str = "pdf") -> None:
+    """
+    Polls the conference schedules of the teams and downloads box scores, stats and articles as soon as a new result
+    has been posted. Polling is fast while a result is expected and slow otherwise. Runs until interrupted.
+
+    Args:
+        teams_data: List of dictionaries containing team data.
+        article_format: The format articles are saved in, either "pdf" or one of the text formats.
+
+    Returns:
+        None
+    """
+    state = load_watch_state()
+
+    with create_http_session() as session:
+        while True:
+            kickoff_times = []
+            for schedule_url, schedule_teams in group_teams_by_schedule_url(teams_data).items():
+                try:
+                    kickoff_times.extend(poll_schedule(session, state, schedule_url, schedule_teams, article_format))
+                except Exception as e:
+                    print(f"{BOLD}{RED}[ERROR]{NORMAL} Failed to check \"{schedule_url}\" ({e})")
+                    kickoff_times.extend(get_known_kickoff_times(state, schedule_url))
+
+            save_watch_state(state)
+
+            delay = next_poll_delay(kickoff_times, datetime.now())
+            print(f"{BOLD}{GREEN}[WATCH]{NORMAL} Next check at {(datetime.now() + timedelta(seconds=delay)):%H:%M:%S}")
+            time.sleep(delay)
+
+
+def poll_schedule(session: requests.Session, state: dict, schedule_url: str, schedule_teams: list[dict],
+                  article_format: str = "pdf") -> list[datetime]:
+    """
+    Checks a schedule page once and downloads the files of every team with new results on it. A Sidearm calendar
+    replaces the cached copy, so the box scores and stats downloaded for new results are looked up on the fresh one.
+
+    Args:
+        session: The HTTP session to send requests with.
+        state: The watch state, holding page validators, kickoff times and known box scores.
+        schedule_url: URL of the schedule page.
+        schedule_teams: List of dictionaries containing the data of the teams found on the page.
+        article_format: The format articles are saved in, either "pdf" or one of the text formats.
+
+    Returns:
+        List of the kickoff times found on the page, in local time.
+    """
+    doc = fetch_schedule_if_modified(session, state, schedule_url)
+    if doc is None:
+        return get_known_kickoff_times(state, schedule_url)
+
+    kickoff_times = extract_kickoff_times(doc)
+    state.setdefault("kickoffs", {})[schedule_url] = [kickoff.isoformat() for kickoff in kickoff_times]
+
+    if (schedule_teams[0]["conference_schedule_provider"] == "Sidearm") and (doc.find("table") is not None):
+        store_sidearm_calendar(schedule_teams[0]["conference_base_url"], doc.find_all("table"))
+
+    for team_data in schedule_teams:
+        handle_new_results(state, team_data, get_box_score_urls(doc, team_data), article_format)
+
+    return kickoff_times
+
+
+def get_known_kickoff_times(state: dict, schedule_url: str) -> list[datetime]:
+    """
+    Get the kickoff times found on a schedule page during a previous check.
+
+    Args:
+        state: The watch state, holding the kickoff times of every schedule page.
+        schedule_url: URL of the schedule page.
+
+    Returns:
+        List of kickoff times in local time.
+    """
+    return [datetime.fromisoformat(kickoff) for kickoff in state.get("kickoffs", {}).get(schedule_url, [])]
+
+
+def group_teams_by_schedule_url(teams_data: list[dict]) -> dict[str, list[dict]]:
+    """
+    Groups teams by the conference schedule page their results are posted on, so each page is polled once.
+
+    Args:
+        teams_data: List of dictionaries containing team data.
+
+    Returns:
+        Dictionary mapping each schedule URL to the teams found on it.
+    """
+    schedule_teams = {}
+    for team_data in teams_data:
+        if team_data["conference_schedule_provider"] == "Boost":
+            schedule_url = f"{team_data['conference_base_url']}/msoc/schedule/?teamFilter={team_data['abbreviation']}"
+        else:
+            schedule_url = f"{team_data['conference_base_url']}/calendar.aspx?path=msoc"
+
+        schedule_teams.setdefault(schedule_url, []).append(team_data)
+
+    return schedule_teams
+
+
+def fetch_schedule_if_modified(session: requests.Session, state: dict, schedule_url: str) -> BeautifulSoup | None:
+    """
+    Fetches a schedule page with a conditional request, so an unchanged page costs a single empty response. Pages
+    that only render their tables with JavaScript are fetched with the browser instead, and are always fetched in
+    full since their HTML does not change when results are posted.
+
+    Args:
+        session: The HTTP session to send requests with.
+        state: The watch state, holding the validators of previously fetched pages.
+        schedule_url: URL of the schedule page.
+
+    Returns:
+        The parsed schedule page. None is returned if the page has not changed or could not be fetched.
+    """
+    validators = state.setdefault("validators", {}).get(schedule_url, {})
+
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    try:
+        response = session.get(schedule_url, headers=headers, timeout=HTTP_TIMEOUT)
+    except requests.RequestException as e:
+        print(f"{BOLD}{RED}[ERROR]{NORMAL} Failed to check \"{schedule_url}\" ({e})")
+        return None
+
+    record_cache_lookup("schedule", response.status_code == 304)
+    if response.status_code == 304:
+        return None
+
+    if not response.ok:
+        print(f"{BOLD}{RED}[ERROR]{NORMAL} Failed to check \"{schedule_url}\" (HTTP {response.status_code})")
+        return None
+
+    doc = BeautifulSoup(response.text, "lxml")
+    if doc.find("table") is not None:
+        state["validators"][schedule_url] = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified")
+        }
+        return doc
+
+    state["validators"].pop(schedule_url, None)
+
+    lazy_driver = LazyWebDriver()
+    try:
+        driver = lazy_driver.get()
+        driver.get(schedule_url)
+        time.sleep(1)
+        return BeautifulSoup(driver.page_source, "lxml")
+    finally:
+        lazy_driver.quit()
+
+
+def get_box_score_urls(doc: BeautifulSoup, team_data: dict) -> list[str]:
+    """
+    Get the URLs of every box score of a team posted on a schedule page.
+
+    Args:
+        doc: The BeautifulSoup object containing the parsed HTML.
+        team_data: Dictionary containing team data.
+
+    Returns:
+        List of box score URLs, from oldest to newest.
+    """
+    if doc.find("table") is None:
+        return []
+
+    if team_data["conference_schedule_provider"] == "Boost":
+        return get_boost_box_score_pdf_urls(doc, team_data["name"], team_data["abbreviation"], len(doc.find_all("tr")))
+
+    return [match[3] for match in extract_matches(team_data, doc.find_all("table"))]
+
+
+def handle_new_results(state: dict, team_data: dict, box_score_urls: list[str], article_format: str = "pdf") -> None:
+    """
+    Compares a team's box scores against the last known set and downloads the new box scores, current season stats
+    and articles when new results have been posted. The first check of a team only records its box scores.
+
+    Args:
+        state: The watch state, holding the known box scores of every team.
+        team_data: Dictionary containing team data.
+        box_score_urls: List of the team's box score URLs, from oldest to newest.
+        article_format: The format articles are saved in, either "pdf" or one of the text formats.
+
+    Returns:
+        None
+    """
+    known_results = state.setdefault("results", {})
+    team_state = known_results.get(team_data["name"])
+
+    now = datetime.now()
+    known_results[team_data["name"]] = {"box_scores": box_score_urls, "checked_at": now.isoformat(timespec="seconds")}
+
+    if team_state is None:
+        return
+
+    new_box_score_urls = [url for url in box_score_urls if url not in team_state["box_scores"]]
+    if not new_box_score_urls:
+        return
+
+    print(f"{BOLD}{GREEN}[WATCH]{NORMAL} Found {len(new_box_score_urls)} new result(s) for {team_data['name']}")
+
+    download_box_scores_by_url(team_data, new_box_score_urls)
+    download_stats_for_teams([team_data], [str(now.year)])
+
+    last_checked_date = datetime.fromisoformat(team_state["checked_at"]).date()
+    articles = fetch_articles(team_data, [last_checked_date, now.date()])
+    if articles is None:
+        return
+
+    if article_format == "pdf":
+        download_articles(articles, {"team": team_data["name"]})
+    else:
+        extract_articles(articles, article_format, {"team": team_data["name"]})
+
+
+def extract_kickoff_times(doc: BeautifulSoup) -> list[datetime]:
+    """
+    Extracts the kickoff times of matches from the machine-readable time elements of a schedule page.
+
+    Args:
+        doc: The BeautifulSoup object containing the parsed HTML.
+
+    Returns:
+        List of kickoff times in local time.
+    """
+    kickoff_times = []
+    for time_tag in doc.find_all("time", attrs={"datetime": True}):
+        try:
+            kickoff_time = datetime.fromisoformat(time_tag["datetime"].replace("Z", "+00:00"))
+        except ValueError:
+            continue
+
+        if kickoff_time.tzinfo is not None:
+            kickoff_time = kickoff_time.astimezone().replace(tzinfo=None)
+
+        kickoff_times.append(kickoff_time)
+
+    return kickoff_times
+
+
+def next_poll_delay(kickoff_times: list[datetime], now: datetime) -> float:
+    """
+    Decides how long to wait before the next check. Checks are frequent from shortly after a kickoff until a few
+    hours later, when a result is expected, and infrequent otherwise.
+
+    Args:
+        kickoff_times: List of kickoff times in local time.
+        now: The current time.
+
+    Returns:
+        The number of seconds to wait.
+    """
+    if not kickoff_times:
+        return IDLE_POLL_SECONDS
+
+    for kickoff_time in kickoff_times:
+        if kickoff_time + RESULT_WINDOW_START <= now <= kickoff_time + RESULT_WINDOW_END:
+            return ACTIVE_POLL_SECONDS
+
+    upcoming_windows = [kickoff_time + RESULT_WINDOW_START for kickoff_time in kickoff_times
+                        if kickoff_time + RESULT_WINDOW_START > now]
+    if not upcoming_windows:
+        return IDLE_POLL_SECONDS
+
+    seconds_until_window = (min(upcoming_windows) - now).total_seconds()
+    return max(ACTIVE_POLL_SECONDS, min(IDLE_POLL_SECONDS, seconds_until_window))
+
+
+def load_watch_state() -> dict:
+    """
+    Loads the watch state saved by previous checks.
+
+    Returns:
+        Dictionary holding page validators, kickoff times and known box scores.
+    """
+    if not WATCH_STATE_PATH.exists():
+        return {}
+
+    with open(WATCH_STATE_PATH, "r") as file:
+        return json.load(file)
+
+
+def save_watch_state(state: dict) -> None:
+    """
+    Saves the watch state.
+
+    Args:
+        state: Dictionary holding page validators, kickoff times and known box scores.
+
+    Returns:
+        None
+    """
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(WATCH_STATE_PATH, "w") as file:
+        json.dump(state, file, indent=2)
@@ -0,0 +1,403 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager, ExitStack
+from datetime import datetime
+from typing import Iterator
+
+from articles import fetch_articles, download_articles, extract_articles
+from box_scores import download_box_scores, download_conference_box_scores
+from metrics import FAILURES, FILES
+from postprocess import optimize_output
+from renderers import close_renderers
+from roster import download_roster
+from schedule import download_schedule
+from stats import download_stats_for_teams
+from utils import print_failure_message, BOLD, GREEN, NORMAL, RED
+
+LEASE_SECONDS = 300
+HEARTBEAT_SECONDS = 60
+MAX_ATTEMPTS = 3
+
+QUEUE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS units (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        team TEXT NOT NULL,
+        category TEXT NOT NULL,
+        argument TEXT NOT NULL DEFAULT '',
+        status TEXT NOT NULL DEFAULT 'pending',
+        worker TEXT,
+        lease_expires REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        result TEXT,
+        options TEXT NOT NULL DEFAULT '{}',
+        UNIQUE (team, category, argument)
+    )
+"""
+
+DEFAULT_RUN_OPTIONS = {"renderer": None, "article_format": "pdf", "optimize": False}
+
+
+def plan_units(teams_data: list[dict], roster: bool, schedule: bool, years: list[str] | None,
+               box_scores: int | None, date_range: list | None,
+               conference: bool = False) -> list[tuple[str, str, str]]:
+    """
+    Expands the requested downloads into independent units of work, one per team, category and year. Box scores
+    downloaded for whole conferences are planned as one unit per conference, named after its first selected team.
+
+    Args:
+        teams_data: List of dictionaries containing team data.
+        roster: Whether rosters are downloaded.
+        schedule: Whether schedules are downloaded.
+        years: Years for which to download stats, if any.
+        box_scores: The number of box scores to download per team, if any.
+        date_range: Range of dates to download articles from, if any.
+        conference: Whether box scores are downloaded for every team in the selected teams' conferences.
+
+    Returns:
+        List of units represented as a tuple of the form (team, category, argument).
+    """
+    units = []
+    if (box_scores is not None) and conference:
+        conference_teams = {}
+        for team_data in teams_data:
+            conference_teams.setdefault(team_data["conference_base_url"], team_data["name"])
+        for team_name in conference_teams.values():
+            units.append((team_name, "conference_box_scores", str(box_scores)))
+
+    for team_data in teams_data:
+        if roster:
+            units.append((team_data["name"], "roster", ""))
+        if schedule:
+            units.append((team_data["name"], "schedule", ""))
+        for year in (years or []):
+            units.append((team_data["name"], "stats", str(year)))
+        if (box_scores is not None) and (not conference):
+            units.append((team_data["name"], "box_scores", str(box_scores)))
+        if date_range is not None:
+            units.append((team_data["name"], "articles", " ".join(date.isoformat() for date in date_range)))
+
+    return units
+
+
+def select_shard(units: list[tuple[str, str, str]], shard_index: int, shard_count: int) -> list[tuple[str, str, str]]:
+    """
+    Selects the units belonging to one shard of a static partition. Units are assigned by a stable hash, so every
+    process computes the same partition without coordinating.
+
+    Args:
+        units: List of units represented as a tuple of the form (team, category, argument).
+        shard_index: The index of the shard, from 0 to shard_count - 1.
+        shard_count: The number of shards.
+
+    Returns:
+        List of the shard's units.
+    """
+    return [unit for unit in units if zlib.crc32("|".join(unit).encode("utf-8")) % shard_count == shard_index]
+
+
+def run_unit(teams: dict, unit: tuple[str, str, str], options: dict | None = None) -> tuple[int, int]:
+    """
+    Downloads the files of a single unit of work to the current working directory. The download functions report
+    their own failures, so the outcome is counted from the files written and failures reported while the unit runs.
+    Units must therefore run one at a time.
+
+    Args:
+        teams: Dictionary of team data keyed by team name.
+        unit: Unit represented as a tuple of the form (team, category, argument).
+        options: Dictionary of the run options the unit was planned with (renderer, article_format, optimize).
+
+    Returns:
+        The number of files written and the number of downloads that failed.
+    """
+    options = {**DEFAULT_RUN_OPTIONS, **(options or {})}
+
+    files_before, failures_before = FILES.total(), FAILURES.total()
+    with ExitStack() as stack:
+        if options["optimize"]:
+            stack.enter_context(optimize_output())
+
+        download_unit(teams, unit, options)
+    return int(FILES.total() - files_before), int(FAILURES.total() - failures_before)
+
+
+def download_unit(teams: dict, unit: tuple[str, str, str], options: dict) -> None:
+    """
+    Calls the download function of a unit's category.
+
+    Args:
+        teams: Dictionary of team data keyed by team name.
+        unit: Unit represented as a tuple of the form (team, category, argument).
+        options: Dictionary of the run options the unit was planned with (renderer, article_format, optimize).
+
+    Returns:
+        None
+    """
+    team_name, category, argument = unit
+    team_data = teams[team_name]
+    renderer = options["renderer"] or team_data.get("renderer", "chrome")
+
+    if category == "roster":
+        filename = f"{team_data['abbreviation']} Roster.pdf"
+        download_roster(team_data["roster_url"], filename, {"team": team_data["name"], "category": "Roster"},
+                        renderer)
+        close_renderers()
+    elif category == "schedule":
+        filename = f"{team_data['abbreviation']} Schedule.pdf"
+        download_schedule(team_data["name"], team_data["schedule_url"], filename,
+                          {"team": team_data["name"], "category": "Schedule"}, renderer)
+        close_renderers()
+    elif category == "stats":
+        download_stats_for_teams([team_data], [argument])
+    elif category == "box_scores":
+        download_box_scores(team_data, int(argument))
+    elif category == "conference_box_scores":
+        conference_teams = [conference_team for conference_team in teams.values()
+                            if conference_team["conference_base_url"] == team_data["conference_base_url"]]
+        download_conference_box_scores(conference_teams, int(argument))
+    elif category == "articles":
+        date_range = [datetime.fromisoformat(date).date() for date in argument.split(" ")]
+        articles = fetch_articles(team_data, date_range)
+        if articles is None:
+            raise RuntimeError("Failed to fetch articles")
+
+        if options["article_format"] == "pdf":
+            download_articles(articles, {"team": team_data["name"]})
+        else:
+            extract_articles(articles, options["article_format"], {"team": team_data["name"]})
+    else:
+        raise ValueError(f"Unknown category \"{category}\"")
+
+
+def run_units(teams: dict, units: list[tuple[str, str, str]], options: dict | None = None) -> None:
+    """
+    Downloads the files of several units of work one after another.
+
+    Args:
+        teams: Dictionary of team data keyed by team name.
+        units: List of units represented as a tuple of the form (team, category, argument).
+        options: Dictionary of the run options applied to every unit (renderer, article_format, optimize).
+
+    Returns:
+        None
+    """
+    for unit in units:
+        try:
+            files, failures = run_unit(teams, unit, options)
+        except Exception as e:
+            print_failure_message(" ".join(unit).strip(), str(e))
+            continue
+
+        if failures > 0:
+            print(f"{BOLD}{RED}[UNIT]{NORMAL} {' '.join(unit).strip()}: {describe_outcome(files, failures)}")
+
+
+def describe_outcome(files: int, failures: int) -> str:
+    """
+    Describes the outcome of a unit of work, stored as the unit's result in the work queue.
+
+    Args:
+        files: The number of files written.
+        failures: The number of downloads that failed.
+
+    Returns:
+        The description of the outcome.
+    """
+    return f"{files} file(s) written, {failures} failed"
+
+
+class WorkQueue:
+    """
+    Work queue stored in a SQLite database, which may live on a volume shared by several machines. Workers claim
+    units with a lease that is kept alive by heartbeats, so units of a crashed worker are claimed again once their
+    lease expires.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        with self.connect() as connection:
+            connection.execute(QUEUE_SCHEMA)
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(units)").fetchall()]
+            if "options" not in columns:
+                connection.execute("ALTER TABLE units ADD COLUMN options TEXT NOT NULL DEFAULT '{}'")
+
+    @contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        """
+        Opens a new connection to the queue database, closed when the context exits. Connections are not shared
+        between threads.
+
+        Returns:
+            Iterator yielding the connection.
+        """
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def enqueue(self, units: list[tuple[str, str, str]], options: dict | None = None) -> int:
+        """
+        Adds units to the queue, skipping units that are already queued.
+
+        Args:
+            units: List of units represented as a tuple of the form (team, category, argument).
+            options: Dictionary of the run options the units are downloaded with (renderer, article_format,
+                optimize), stored with each unit.
+
+        Returns:
+            The number of units added.
+        """
+        options_json = json.dumps(options or {})
+        with self.connect() as connection:
+            before = connection.execute("SELECT COUNT(*) FROM units").fetchone()[0]
+            connection.executemany(
+                "INSERT OR IGNORE INTO units (team, category, argument, options) VALUES (?, ?, ?, ?)",
+                [(*unit, options_json) for unit in units]
+            )
+            return connection.execute("SELECT COUNT(*) FROM units").fetchone()[0] - before
+
+    def claim(self) -> tuple[int, tuple[str, str, str], dict] | None:
+        """
+        Claims the next pending unit, or a unit whose lease has expired.
+
+        Returns:
+            The id of the claimed unit, the unit and the run options it was planned with. None is returned if no unit
+            is available.
+        """
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "UPDATE units SET status = 'failed', result = 'lease expired' "
+                    "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (time.time(), MAX_ATTEMPTS)
+                )
+                row = connection.execute(
+                    "SELECT id, team, category, argument, options FROM units "
+                    "WHERE (status = 'pending') OR (status = 'leased' AND lease_expires < ? AND attempts < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (time.time(), MAX_ATTEMPTS)
+                ).fetchone()
+
+                if row is not None:
+                    connection.execute(
+                        "UPDATE units SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                        "WHERE id = ?",
+                        (self.worker, time.time() + LEASE_SECONDS, row[0])
+                    )
+                connection.execute("COMMIT")
+            except sqlite3.Error:
+                connection.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+
+        return row[0], (row[1], row[2], row[3]), json.loads(row[4])
+
+    def heartbeat(self, unit_id: int) -> None:
+        """
+        Extends the lease of a claimed unit.
+
+        Args:
+            unit_id: The id of the claimed unit.
+
+        Returns:
+            None
+        """
+        with self.connect() as connection:
+            connection.execute("UPDATE units SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                               (time.time() + LEASE_SECONDS, unit_id, self.worker))
+
+    def complete(self, unit_id: int, result: str) -> None:
+        """
+        Marks a claimed unit as done.
+
+        Args:
+            unit_id: The id of the claimed unit.
+            result: A description of the result.
+
+        Returns:
+            None
+        """
+        with self.connect() as connection:
+            connection.execute("UPDATE units SET status = 'done', result = ? WHERE id = ? AND worker = ?",
+                               (result, unit_id, self.worker))
+
+    def fail(self, unit_id: int, reason: str) -> None:
+        """
+        Releases a claimed unit after a failure. The unit is retried until it has been attempted MAX_ATTEMPTS times.
+
+        Args:
+            unit_id: The id of the claimed unit.
+            reason: The reason why the unit failed.
+
+        Returns:
+            None
+        """
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE units SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, result = ?, "
+                "lease_expires = NULL WHERE id = ? AND worker = ?",
+                (MAX_ATTEMPTS, reason, unit_id, self.worker)
+            )
+
+    def counts(self) -> dict[str, int]:
+        """
+        Counts the units in each status.
+
+        Returns:
+            Dictionary mapping each status to its number of units.
+        """
+        with self.connect() as connection:
+            return dict(connection.execute("SELECT status, COUNT(*) FROM units GROUP BY status").fetchall())
+
+
+def run_worker(teams: dict, work_queue: WorkQueue) -> None:
+    """
+    Claims and downloads units from the queue until no unit is left, keeping the lease of the current unit alive.
+    Each unit is downloaded with the run options it was planned with.
+
+    Args:
+        teams: Dictionary of team data keyed by team name.
+        work_queue: The work queue to claim units from.
+
+    Returns:
+        None
+    """
+    while True:
+        claimed = work_queue.claim()
+        if claimed is None:
+            break
+
+        unit_id, unit, options = claimed
+        stop_heartbeat = threading.Event()
+
+        def send_heartbeats() -> None:
+            while not stop_heartbeat.wait(HEARTBEAT_SECONDS):
+                work_queue.heartbeat(unit_id)
+
+        heartbeat_thread = threading.Thread(target=send_heartbeats, daemon=True)
+        heartbeat_thread.start()
+        try:
+            files, failures = run_unit(teams, unit, options)
+            if failures > 0:
+                work_queue.fail(unit_id, describe_outcome(files, failures))
+            else:
+                work_queue.complete(unit_id, describe_outcome(files, failures))
+        except Exception as e:
+            work_queue.fail(unit_id, str(e))
+            print_failure_message(" ".join(unit).strip(), str(e))
+        finally:
+            stop_heartbeat.set()
+            heartbeat_thread.join()
+
+    counts = work_queue.counts()
+    print(f"{BOLD}{GREEN}[QUEUE]{NORMAL} {counts.get('done', 0)} done, {counts.get('leased', 0)} in progress, "
+          f"{counts.get('failed', 0)} failed")